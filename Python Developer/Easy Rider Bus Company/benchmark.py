@@ -0,0 +1,116 @@
+import argparse
+import json
+import random
+import time
+import tracemalloc
+from itertools import combinations
+
+from easyrider import BusArrivals, EasyRider, StopInformation, StopRecord
+
+
+STREET_TYPES = ["Road", "Avenue", "Boulevard", "Street"]
+
+
+def generate_network(lines: int, stops_per_line: int, stop_names: int, seed: int = 0) -> list:
+    """
+    Generates a valid feed: every line visits stops_per_line stops drawn from a shared pool of names, starting with
+    an "S" stop and ending with an "F" stop.
+
+    :param lines: Number of bus lines.
+    :param stops_per_line: Stops on every line.
+    :param stop_names: Size of the pool of stop names the lines share.
+    :param seed: Random seed, so that every run benchmarks the same network.
+    :return: List of stop dicts.
+    """
+    rng = random.Random(seed)
+    names = [f"Stop{''.join(chr(ord('a') + int(digit)) for digit in str(n))} {STREET_TYPES[n % 4]}"
+             for n in range(stop_names)]
+    stops = []
+    for bus_id in range(1, lines + 1):
+        chosen = rng.sample(range(stop_names), stops_per_line)
+        minutes = rng.randint(5 * 60, 10 * 60)
+        for position, stop_id in enumerate(chosen):
+            minutes += rng.randint(1, 10)
+            last = position == stops_per_line - 1
+            stops.append({"bus_id": bus_id,
+                          "stop_id": stop_id + 1,
+                          "stop_name": names[stop_id],
+                          "next_stop": 0 if last else chosen[position + 1] + 1,
+                          "stop_type": "S" if position == 0 else "F" if last else "",
+                          "a_time": f"{minutes // 60 % 24:02d}:{minutes % 60:02d}"})
+    return stops
+
+
+def pairwise_transfer_stops(stops: list) -> set:
+    """
+    The previous transfer stop detection: intersect the stops of every pair of lines.
+    """
+    bus_all_stops_dict = {}
+    for stop in stops:
+        bus_all_stops_dict.setdefault(stop["bus_id"], set()).add(stop["stop_name"])
+    transfer_list = list(bus_all_stops_dict.values())
+    full_intersection = set()
+    for first, second in combinations(range(len(transfer_list)), 2):
+        full_intersection |= transfer_list[first] & transfer_list[second]
+    return full_intersection
+
+
+def benchmark_transfer_stops(lines: int, stops_per_line: int, stop_names: int, pairwise: bool):
+    stops = generate_network(lines, stops_per_line, stop_names)
+    start = time.perf_counter()
+    stop_information = StopInformation()
+    for stop in map(StopRecord.from_dict, stops):
+        stop_information.add(stop)
+    transfer_stops = stop_information.get_transfer_stops()
+    seconds = time.perf_counter() - start
+    print(f"Inverted index: {len(transfer_stops):,} transfer stops among {len(stops):,} stops on {lines:,} lines "
+          f"in {seconds:.3f}s")
+    if pairwise:
+        start = time.perf_counter()
+        expected = pairwise_transfer_stops(stops)
+        seconds = time.perf_counter() - start
+        print(f"Pairwise intersections: {len(expected):,} transfer stops in {seconds:.3f}s")
+        if expected != set(transfer_stops):
+            raise AssertionError("Both methods should find the same transfer stops.")
+
+
+def benchmark_stop_records(lines: int, stops_per_line: int, stop_names: int):
+    """
+    Compares the memory kept by a feed loaded as dicts and as StopRecords, and times the arrival time check.
+    """
+    json_data = json.dumps(generate_network(lines, stops_per_line, stop_names))
+    stop_count = lines * stops_per_line
+    for name, load in (("dicts", json.loads), ("records", lambda text: EasyRider(text).json_data)):
+        tracemalloc.start()
+        stops = load(json_data)
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"Stops as {name}: {retained / stop_count:.0f} bytes per stop, {peak / 1024 ** 2:.1f} MiB peak")
+        del stops
+    stops = EasyRider(json_data).json_data
+    start = time.perf_counter()
+    bus_arrivals = BusArrivals()
+    for stop in stops:
+        bus_arrivals.add(stop)
+    print(f"Arrival time check: {time.perf_counter() - start:.3f}s for {stop_count:,} stops")
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Benchmark EasyRider on a generated network.")
+    arg_parser.add_argument("--lines",
+                            type=int,
+                            default=5000,
+                            help="Number of bus lines in the generated network.")
+    arg_parser.add_argument("--stops-per-line",
+                            type=int,
+                            default=20)
+    arg_parser.add_argument("--stop-names",
+                            type=int,
+                            default=20_000,
+                            help="Number of distinct stops the lines share.")
+    arg_parser.add_argument("--skip-pairwise",
+                            action="store_true",
+                            help="Do not time the previous pairwise method, which is quadratic in the number of lines.")
+    args = arg_parser.parse_args()
+    benchmark_transfer_stops(args.lines, args.stops_per_line, args.stop_names, not args.skip_pairwise)
+    benchmark_stop_records(args.lines, args.stops_per_line, args.stop_names)
@@ -1,15 +1,250 @@
+import argparse
+import io
 import json
+import multiprocessing
+import os
 import re
-from itertools import combinations
+import sys
+from abc import ABC, abstractmethod
+from collections import Counter, deque
+from enum import IntEnum
+from functools import partial
+from itertools import chain, islice
 
 
-class EasyRider:
-    def __init__(self, json_data: str):
+# Patterns are compiled once and shared by every stop.
+STOP_NAME_PATTERN = re.compile(r"([A-Z][a-z]+\s)+(Road|Avenue|Boulevard|Street)$")
+# Fields that must be integers.
+INT_FIELDS = ["bus_id", "stop_id", "next_stop"]
+# White space allowed between JSON values.
+WHITESPACE_PATTERN = re.compile(r"[ \t\n\r]*")
+# Characters read from a streamed feed at a time.
+READ_CHUNK_SIZE = 64 * 1024
+# Characters a single stop may take in a streamed feed. A value that still does not decode once this much of it is
+# buffered is a syntax error rather than a value continuing in the next chunk.
+MAX_RECORD_SIZE = 1024 * 1024
+# Lines of a JSON Lines feed decoded together.
+JSON_LINES_BATCH_SIZE = 10_000
+# Stops validated together by the columnar engine, so that streamed feeds are never held in memory whole.
+VALIDATION_BATCH_SIZE = 100_000
+
+
+class StopType(IntEnum):
+    NORMAL = 0
+    START = 1
+    ON_DEMAND = 2
+    FINISH = 3
+    # Anything stop_type should not be.
+    INVALID = 4
+    # "S", "O" or "F" followed by a newline. The format check accepts it, like $ in a pattern, but the other checks
+    # compare stop types for equality and treat it as a normal stop.
+    SUFFIXED = 5
+
+
+STOP_TYPES = {"": StopType.NORMAL, "S": StopType.START, "O": StopType.ON_DEMAND, "F": StopType.FINISH,
+              "\n": StopType.NORMAL, "S\n": StopType.SUFFIXED, "O\n": StopType.SUFFIXED, "F\n": StopType.SUFFIXED}
+# Minutes after midnight of every valid a_time ("[0-2][0-9]:[0-5][0-9]"). Looking times up here also shares one int
+# object per time between all stops.
+A_TIME_MINUTES = {f"{hours:02d}:{minutes:02d}": hours * 60 + minutes for hours in range(30) for minutes in range(60)}
+# Valid a_time strings indexed by minutes after midnight.
+A_TIME_TEXTS = list(A_TIME_MINUTES)
+
+
+def strip_final_newline(value: str) -> str:
+    # Like $ in a pattern, allow a final newline after a time.
+    return value[:-1] if value[-1:] == "\n" else value
+
+
+def share_id(value, shared_ids: dict):
+    if type(value) is int:
+        return shared_ids.setdefault(value, value)
+    return value
+
+
+class StopRecord:
+    """
+    Compact stop: a_time is stored as minutes after midnight and stop_type as a StopType, so that neither has to be
+    matched against a pattern again. Invalid stop types become StopType.INVALID. Invalid times keep their original
+    string so that they are still ordered like before, and times that are not strings at all become None.
+    Stop names and ids are interned, so stops with the same name or id share one object.
+    """
+    __slots__ = ("bus_id", "stop_id", "stop_name", "next_stop", "stop_type", "a_time")
+
+    def __init__(self, bus_id, stop_id, stop_name, next_stop, stop_type: StopType, a_time: int | str | None):
+        self.bus_id = bus_id
+        self.stop_id = stop_id
+        self.stop_name = stop_name
+        self.next_stop = next_stop
+        self.stop_type = stop_type
+        self.a_time = a_time
+
+    @classmethod
+    def from_dict(cls, stop: dict, shared_ids: dict = None) -> "StopRecord":
         """
-        Parses through json_data and validates input data.
-        :param json_data: Company data from Easy Rider Bus Company in JSON format
+        :param stop: Stop as loaded from JSON. Also usable as json.loads() object_hook, so that the dicts are never
+        kept.
+        :param shared_ids: Table of the bus_id, stop_id and next_stop ints seen so far, so that records kept together
+        share one int object per value, like sys.intern() for the stop names. json creates a new int for every number
+        it reads, which takes more memory than the rest of a StopRecord. None when the records are not kept, as the
+        table would only grow.
+        :return: StopRecord
         """
-        self.json_data = json.loads(json_data)
+        stop_name = stop.get("stop_name")
+        stop_type = stop.get("stop_type")
+        a_time = stop.get("a_time")
+        if type(stop_type) is str:
+            stop_type = STOP_TYPES.get(stop_type, StopType.INVALID)
+        else:
+            stop_type = StopType.INVALID
+        if type(a_time) is str:
+            a_time = A_TIME_MINUTES.get(strip_final_newline(a_time), a_time)
+        else:
+            a_time = None
+        bus_id = stop.get("bus_id")
+        stop_id = stop.get("stop_id")
+        next_stop = stop.get("next_stop")
+        if shared_ids is not None:
+            bus_id = share_id(bus_id, shared_ids)
+            stop_id = share_id(stop_id, shared_ids)
+            next_stop = share_id(next_stop, shared_ids)
+        return cls(bus_id,
+                   stop_id,
+                   sys.intern(stop_name) if type(stop_name) is str else stop_name,
+                   next_stop,
+                   stop_type,
+                   a_time)
+
+
+def to_columns(stops: list) -> dict:
+    """
+    Converts a list of stop records into one list per field.
+
+    :param stops: StopRecords.
+    :return: Dict of field name to the list of that field's values.
+    """
+    return {field: [getattr(stop, field) for stop in stops] for field in StopRecord.__slots__}
+
+
+def count_type_errors(column: list) -> int:
+    # Counting the types runs in C. Like validate_bus_id(), this uses type() so that bools are errors too.
+    types = Counter(map(type, column))
+    return len(column) - types[int]
+
+
+def count_pattern_errors(column: list, pattern: re.Pattern) -> int:
+    """
+    Counts the values of column that do not match pattern. Timetables repeat the same stop names, stop types and
+    times over and over, so every distinct value is matched once and weighted by how often it occurs.
+
+    :param column: Values of one field.
+    :param pattern: Compiled pattern the values must match.
+    :return: Number of invalid values.
+    """
+    return sum(count for value, count in Counter(column).items() if not pattern.match(value))
+
+
+class FeedReader:
+    """
+    Reads the stops of a feed one at a time, holding only about READ_CHUNK_SIZE characters of it in memory. The feed
+    is either a JSON array of stops, like the single line feeds, or JSON Lines with one stop per line.
+    """
+    def __init__(self, stream, chunk_size: int = READ_CHUNK_SIZE, max_record_size: int = MAX_RECORD_SIZE):
+        """
+        :param stream: Text stream to read the feed from, such as an open file or sys.stdin.
+        :param chunk_size: Characters read at a time.
+        :param max_record_size: Characters one stop may take. Decoding errors are raised once this much is buffered.
+        """
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.max_record_size = max_record_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+
+    def fill(self) -> bool:
+        """
+        Drops the part of the buffer already decoded and reads another chunk.
+
+        :return: False at the end of the stream.
+        """
+        chunk = self.stream.read(self.chunk_size)
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return bool(chunk)
+
+    def peek(self) -> str:
+        """
+        Skips white space.
+
+        :return: The next character, or an empty string at the end of the stream.
+        """
+        while True:
+            self.position = WHITESPACE_PATTERN.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer) or not self.fill():
+                return self.buffer[self.position:self.position + 1]
+
+    def decode(self):
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                # The value may continue in the next chunk, unless the stream has ended or no stop is that long.
+                if len(self.buffer) - self.position >= self.max_record_size or not self.fill():
+                    raise
+                continue
+            # A value ending exactly at the end of the buffer, such as a number, might still continue.
+            if end == len(self.buffer) and self.fill():
+                continue
+            self.position = end
+            return value
+
+    def __iter__(self):
+        if self.peek() != "[":
+            # JSON Lines. The rest of the line already in the buffer is completed with readline() so that the stream
+            # can split the remaining lines itself. Lines are decoded in batches as one array, which is much faster
+            # than a json.loads() call per line.
+            lines = chain(io.StringIO(self.buffer[self.position:] + self.stream.readline()), self.stream)
+            while batch := [line for line in islice(lines, JSON_LINES_BATCH_SIZE) if not line.isspace()]:
+                yield from json.loads("[" + ",".join(batch) + "]")
+            return
+        self.position += 1
+        while True:
+            char = self.peek()
+            if char == ",":
+                self.position += 1
+                char = self.peek()
+            if not char or char == "]":
+                return
+            yield self.decode()
+
+
+class Analysis(ABC):
+    """
+    One analysis of a feed, written as an accumulator: add() is called with every stop during a single scan of the
+    feed, and report() prints the result afterwards. result() returns the same result as JSON compatible data for
+    batch reports. Several analyses can share one scan, see EasyRider.run().
+    """
+    @abstractmethod
+    def add(self, stop: StopRecord):
+        pass
+
+    @abstractmethod
+    def report(self):
+        pass
+
+    @abstractmethod
+    def result(self) -> dict:
+        pass
+
+
+class FormatValidation(Analysis):
+    def __init__(self, engine: str = "columnar"):
+        """
+        :param engine: "columnar" validates whole columns of VALIDATION_BATCH_SIZE stops at once, "row" runs the
+        validators on each stop in turn. Both give the same error_dict.
+        """
+        self.engine = engine
+        self.batch = []
         self.error_dict = {
             "bus_id": 0,
             "stop_id": 0,
@@ -18,162 +253,576 @@ class EasyRider:
             "stop_type": 0,
             "a_time": 0
         }
-        self.bus_set = set()
-        self.bus_line_dict = {}
-        self.bus_start_dict = {}
-        self.bus_final_dict = {}
-        self.bus_all_stops_dict = {}
-        self.prev_stop_time_dict = {}
-        self.line_error_status = {}
-        self.normal_stops = set()
-        self.on_demand_stops = set()
 
-    def validate_input(self):
-        for stop in self.json_data:
+    def add(self, stop: StopRecord):
+        if self.engine == "columnar":
+            self.batch.append(stop)
+            if len(self.batch) >= VALIDATION_BATCH_SIZE:
+                self.validate_batch()
+        else:
             self.validate_bus_id(stop)
             self.validate_stop_id(stop)
             self.validate_stop_name(stop)
             self.validate_next_stop(stop)
             self.validate_stop_type(stop)
             self.validate_a_time(stop)
-        self.print_errors()
+
+    def validate_batch(self):
+        self.validate_columns(to_columns(self.batch))
+        self.batch = []
+
+    def validate_columns(self, columns: dict):
+        """
+        Adds the invalid values of every column to error_dict.
+
+        :param columns: Output of to_columns().
+        """
+        for field in INT_FIELDS:
+            self.error_dict[field] += count_type_errors(columns[field])
+        self.error_dict["stop_name"] += count_pattern_errors(columns["stop_name"], STOP_NAME_PATTERN)
+        # Stop types and times were validated when the records were made.
+        self.error_dict["stop_type"] += columns["stop_type"].count(StopType.INVALID)
+        self.error_dict["a_time"] += count_type_errors(columns["a_time"])
 
     def validate_bus_id(self, stop):
-        if type(stop.get("bus_id")) is int:
+        if type(stop.bus_id) is int:
             return
         self.error_dict["bus_id"] += 1
 
     def validate_stop_id(self, stop):
-        if type(stop.get("stop_id")) is int:
+        if type(stop.stop_id) is int:
             return
         self.error_dict["stop_id"] += 1
 
     def validate_stop_name(self, stop):
-        if re.match(r"([A-Z][a-z]+\s)+(Road|Avenue|Boulevard|Street)$", stop.get("stop_name")):
+        if STOP_NAME_PATTERN.match(stop.stop_name):
             return
         self.error_dict["stop_name"] += 1
 
     def validate_next_stop(self, stop):
-        if type(stop.get("next_stop")) is int:
+        if type(stop.next_stop) is int:
             return
         self.error_dict["next_stop"] += 1
 
     def validate_stop_type(self, stop):
-        if re.match(r"^(S|O|F|)$", stop.get("stop_type")):
+        if stop.stop_type != StopType.INVALID:
             return
         self.error_dict["stop_type"] += 1
 
     def validate_a_time(self, stop):
-        if re.match(r"[0-2][0-9]:[0-5][0-9]$", stop.get("a_time")):
+        if type(stop.a_time) is int:
             return
         self.error_dict["a_time"] += 1
 
+    def finish(self):
+        if self.batch:
+            self.validate_batch()
+
+    def report(self):
+        self.finish()
+        self.print_errors()
+
+    def result(self) -> dict:
+        self.finish()
+        return {"errors": sum(self.error_dict.values()), **self.error_dict}
+
     def print_errors(self):
         print("Format validation: {} errors".format(sum(self.error_dict.values())))
         print("stop_name: {}".format(self.error_dict.get("stop_name")))
         print("stop_type: {}".format(self.error_dict.get("stop_type")))
         print("a_time: {}".format(self.error_dict.get("a_time")))
 
-    def bus_line_information(self):
-        for stop in self.json_data:
-            if stop.get("bus_id") in self.bus_line_dict:
-                self.bus_line_dict[stop.get("bus_id")] += 1
-            else:
-                self.bus_line_dict[stop.get("bus_id")] = 1
-        self.print_bus_line_information()
 
-    def print_bus_line_information(self):
+class BusLineInformation(Analysis):
+    def __init__(self):
+        self.bus_line_dict = {}
+
+    def add(self, stop: StopRecord):
+        if stop.bus_id in self.bus_line_dict:
+            self.bus_line_dict[stop.bus_id] += 1
+        else:
+            self.bus_line_dict[stop.bus_id] = 1
+
+    def report(self):
         print("Line names and number of stops:")
         for bus in self.bus_line_dict:
             print(f"bus_id: {bus}, stops: {self.bus_line_dict.get(bus)}")
 
-    def stop_information(self):
-        for stop in self.json_data:
-            current_stop = stop.get("bus_id")
-            if current_stop not in self.bus_set:
-                self.bus_set.add(current_stop)
-            if stop.get("stop_type") == "S":
-                if current_stop in self.bus_start_dict:
-                    print(f"There are multiple start stops for the line: {current_stop}")
-                else:
-                    self.bus_start_dict[current_stop] = stop.get("stop_name")
-            elif stop.get("stop_type") == "F":
-                if current_stop in self.bus_final_dict:
-                    print(f"There are multiple end stops for the line: {current_stop}")
-                else:
-                    self.bus_final_dict[current_stop] = stop.get("stop_name")
-            if current_stop in self.bus_all_stops_dict:
-                self.bus_all_stops_dict[current_stop].add(stop.get("stop_name"))
+    def result(self) -> dict:
+        return {"lines": [{"bus_id": bus, "stops": stops} for bus, stops in self.bus_line_dict.items()]}
+
+
+class StopInformation(Analysis):
+    def __init__(self):
+        self.bus_set = set()
+        self.bus_start_dict = {}
+        self.bus_final_dict = {}
+        # Inverted index of stop_name -> set of bus_ids serving it. Stops served by two or more lines are transfers.
+        self.stop_bus_dict = {}
+        # Problems found while scanning, printed first by report().
+        self.messages = []
+
+    def add(self, stop: StopRecord):
+        current_stop = stop.bus_id
+        if current_stop not in self.bus_set:
+            self.bus_set.add(current_stop)
+        if stop.stop_type == StopType.START:
+            if current_stop in self.bus_start_dict:
+                self.messages.append(f"There are multiple start stops for the line: {current_stop}")
             else:
-                self.bus_all_stops_dict[current_stop] = {stop.get("stop_name")}
+                self.bus_start_dict[current_stop] = stop.stop_name
+        elif stop.stop_type == StopType.FINISH:
+            if current_stop in self.bus_final_dict:
+                self.messages.append(f"There are multiple end stops for the line: {current_stop}")
+            else:
+                self.bus_final_dict[current_stop] = stop.stop_name
+        if stop.stop_name in self.stop_bus_dict:
+            self.stop_bus_dict[stop.stop_name].add(current_stop)
+        else:
+            self.stop_bus_dict[stop.stop_name] = {current_stop}
+
+    def report(self):
+        for message in self.messages:
+            print(message)
+
+        missing_stop = self.get_missing_stop()
+        if missing_stop:
+            print(missing_stop)
+            return
+
+        start_list = self.get_start_stops()
+        print(f"Start stops: {len(start_list)} {start_list}")
+
+        transfer_list = sorted(self.get_transfer_stops())
+        print(f"Transfer stops: {len(transfer_list)} {transfer_list}")
+
+        final_list = self.get_finish_stops()
+        print(f"Finish stops: {len(final_list)} {final_list}")
 
+    def result(self) -> dict:
+        missing_stop = self.get_missing_stop()
+        if missing_stop:
+            return {"errors": [*self.messages, missing_stop]}
+        return {"errors": self.messages,
+                "start_stops": self.get_start_stops(),
+                "transfer_stops": sorted(self.get_transfer_stops()),
+                "finish_stops": self.get_finish_stops()}
+
+    def get_missing_stop(self) -> str | None:
+        """
+        :return: Message about the first line, by bus_id, without a start or end stop, or None if every line has both.
+        """
         for key in sorted(list(self.bus_set)):
             if key not in self.bus_start_dict and key not in self.bus_final_dict:
-                print(f"There is no start or end stop for the line: {key}.")
-                return
+                return f"There is no start or end stop for the line: {key}."
             elif key not in self.bus_start_dict:
-                print(f"There is no start stop for the line: {key}.")
-                return
+                return f"There is no start stop for the line: {key}."
             elif key not in self.bus_final_dict:
-                print(f"There is no end stop for the line: {key}.")
-                return
+                return f"There is no end stop for the line: {key}."
+        return None
 
-        start_set = set()
-        for start in sorted(self.bus_start_dict):
-            start_set.add(self.bus_start_dict.get(start))
-        start_list = sorted(list(start_set))
-        print(f"Start stops: {len(start_list)} {start_list}")
+    def get_start_stops(self) -> list:
+        return sorted(set(self.bus_start_dict.values()))
 
-        transfer_list = [self.bus_all_stops_dict[key] for key in self.bus_all_stops_dict]
-        full_intersection = set()
-        for combo in combinations(range(len(transfer_list)), 2):
-            intersection = transfer_list[combo[0]].copy()
-            for i in combo[1:]:
-                intersection &= transfer_list[i]
-            full_intersection |= intersection
-        transfer_list = sorted(list(full_intersection))
-        print(f"Transfer stops: {len(transfer_list)} {transfer_list}")
+    def get_finish_stops(self) -> list:
+        return sorted(set(self.bus_final_dict.values()))
 
-        final_set = set()
-        for final in sorted(self.bus_final_dict):
-            final_set.add(self.bus_final_dict.get(final))
-        final_list = sorted(list(final_set))
-        print(f"Finish stops: {len(final_list)} {final_list}")
+    def get_transfer_stops(self) -> list:
+        return [stop_name for stop_name, buses in self.stop_bus_dict.items() if len(buses) > 1]
 
-    def validate_bus_arrivals(self):
-        print("Arrival time test:")
-        for stop in self.json_data:
-            current_stop = stop.get("bus_id")
-            if current_stop not in self.prev_stop_time_dict:
-                self.prev_stop_time_dict[current_stop] = ""
-                self.line_error_status[current_stop] = False
-            if self.line_error_status[current_stop]:
-                pass
+
+class BusArrivals(Analysis):
+    def __init__(self):
+        self.prev_stop_time_dict = {}
+        self.line_error_status = {}
+        # (bus_id, stop_name) of the first stop with a wrong arrival time on every line that has one.
+        self.wrong_times = []
+
+    @staticmethod
+    def in_order(prev_time, a_time) -> bool:
+        """
+        Valid times are compared in minutes. Invalid times are compared as strings, which is the order all times had
+        before they were converted, so "38:13" still comes after "08:16". A time that is not a string cannot be
+        ordered at all and is always wrong.
+
+        :param prev_time: a_time of the previous stop of the line, "" for the first stop.
+        :param a_time: a_time of the current stop.
+        :return: Whether a_time is not earlier than prev_time.
+        """
+        if type(a_time) is int and type(prev_time) is int:
+            return a_time >= prev_time
+        if a_time is None:
+            return False
+        if type(a_time) is int:
+            a_time = A_TIME_TEXTS[a_time]
+        if type(prev_time) is int:
+            prev_time = A_TIME_TEXTS[prev_time]
+        return a_time >= prev_time
+
+    def add(self, stop: StopRecord):
+        current_stop = stop.bus_id
+        if current_stop not in self.prev_stop_time_dict:
+            # Below any time string, so the first stop of a line is only wrong if its time is not a string.
+            self.prev_stop_time_dict[current_stop] = ""
+            self.line_error_status[current_stop] = False
+        if self.line_error_status[current_stop]:
+            pass
+        else:
+            if self.in_order(self.prev_stop_time_dict[current_stop], stop.a_time):
+                self.prev_stop_time_dict[current_stop] = stop.a_time
             else:
-                stop_list = [self.prev_stop_time_dict[current_stop], stop.get("a_time")]
-                if stop_list == sorted(stop_list):
-                    self.prev_stop_time_dict[current_stop] = stop.get("a_time")
-                else:
-                    print(f"""bus_id line {stop.get("bus_id")}: wrong time on {stop.get("stop_name")}""")
-                    self.line_error_status[current_stop] = True
+                self.wrong_times.append((stop.bus_id, stop.stop_name))
+                self.line_error_status[current_stop] = True
+
+    def report(self):
+        print("Arrival time test:")
+        for bus_id, stop_name in self.wrong_times:
+            print(f"bus_id line {bus_id}: wrong time on {stop_name}")
         if True in self.line_error_status.values():
             pass
         else:
             print("OK")
 
-    def validate_on_demand(self):
+    def result(self) -> dict:
+        return {"ok": not self.wrong_times,
+                "wrong_times": [{"bus_id": bus_id, "stop_name": stop_name} for bus_id, stop_name in self.wrong_times]}
+
+
+class OnDemandStops(Analysis):
+    def __init__(self):
+        self.normal_stops = set()
+        self.on_demand_stops = set()
+
+    def add(self, stop: StopRecord):
+        if stop.stop_type == StopType.ON_DEMAND:
+            self.on_demand_stops.add(stop.stop_name)
+        else:
+            self.normal_stops.add(stop.stop_name)
+
+    def report(self):
         print("On demand stops test:")
-        for stop in self.json_data:
-            if stop.get("stop_type") == "O":
-                self.on_demand_stops.add(stop.get("stop_name"))
-            else:
-                self.normal_stops.add(stop.get("stop_name"))
         intersecting_stops = sorted(list(self.on_demand_stops & self.normal_stops))
         if intersecting_stops:
             print(f"Wrong stop type: {intersecting_stops}")
         else:
             print("OK")
 
+    def result(self) -> dict:
+        intersecting_stops = sorted(self.on_demand_stops & self.normal_stops)
+        return {"ok": not intersecting_stops, "wrong_stop_type": intersecting_stops}
+
+
+class RouteGraph(Analysis):
+    """
+    Graph of the network built from the stop_id -> next_stop links of every line. After the scan, build() works out
+    the route of every line in topological order, the stops following every stop over all lines and the lines
+    serving every stop. The reachable stops and transfer path queries only look up these indexes.
+    """
+    def __init__(self):
+        # bus_id -> {stop_id: next_stop}, in feed order.
+        self.links = {}
+        self.stop_names = {}
+        # bus_id -> stop_ids of the line in route order, and stop_id -> position in that route.
+        self.routes = {}
+        self.positions = {}
+        # stop_id -> stop_ids following it on any line.
+        self.adjacency = {}
+        # stop_id -> bus_ids serving it.
+        self.stop_lines = {}
+
+    def add(self, stop: StopRecord):
+        bus_id = stop.bus_id
+        stop_id = stop.stop_id
+        if bus_id in self.links:
+            self.links[bus_id][stop_id] = stop.next_stop
+        else:
+            self.links[bus_id] = {stop_id: stop.next_stop}
+        self.stop_names[stop_id] = stop.stop_name
+
+    @staticmethod
+    def sort_route(links: dict) -> tuple:
+        """
+        Orders the stops of one line so that every stop comes before its next_stop (Kahn's algorithm). Stops on a
+        cycle, which have no such order, are added at the end in feed order.
+
+        :param links: stop_id -> next_stop of one line.
+        :return: Tuple of stop_ids.
+        """
+        incoming = dict.fromkeys(links, 0)
+        for next_stop in links.values():
+            if next_stop in incoming:
+                incoming[next_stop] += 1
+        ready = deque(stop_id for stop_id, count in incoming.items() if not count)
+        route = []
+        while ready:
+            stop_id = ready.popleft()
+            route.append(stop_id)
+            next_stop = links[stop_id]
+            if next_stop in incoming:
+                incoming[next_stop] -= 1
+                if not incoming[next_stop]:
+                    ready.append(next_stop)
+        if len(route) < len(links):
+            in_route = set(route)
+            route.extend(stop_id for stop_id in links if stop_id not in in_route)
+        return tuple(route)
+
+    def build(self):
+        adjacency = {}
+        stop_lines = {}
+        for bus_id, links in self.links.items():
+            route = self.sort_route(links)
+            self.routes[bus_id] = route
+            self.positions[bus_id] = {stop_id: position for position, stop_id in enumerate(route)}
+            for stop_id, next_stop in links.items():
+                stop_lines.setdefault(stop_id, []).append(bus_id)
+                if next_stop in links:
+                    adjacency.setdefault(stop_id, set()).add(next_stop)
+        self.adjacency = {stop_id: tuple(next_stops) for stop_id, next_stops in adjacency.items()}
+        self.stop_lines = {stop_id: tuple(bus_ids) for stop_id, bus_ids in stop_lines.items()}
+
+    def report(self):
+        result = self.result()
+        print(f"Route graph: {result['stops']} stops, {result['links']} links, {result['lines']} lines")
+
+    def result(self) -> dict:
+        if len(self.routes) != len(self.links):
+            self.build()
+        return {"stops": len(self.stop_names),
+                "links": sum(len(next_stops) for next_stops in self.adjacency.values()),
+                "lines": len(self.routes)}
+
+    def get_reachable_stops(self, origin) -> set:
+        """
+        :param origin: stop_id to start from.
+        :return: stop_ids that can be reached from origin by following the lines, with any number of transfers.
+        """
+        reachable = set()
+        queue = deque([origin])
+        while queue:
+            for next_stop in self.adjacency.get(queue.popleft(), ()):
+                if next_stop not in reachable:
+                    reachable.add(next_stop)
+                    queue.append(next_stop)
+        return reachable
+
+    def find_transfer_path(self, origin, destination) -> list | None:
+        """
+        Finds a way from origin to destination using as few lines as possible. This is a breadth first search by
+        number of rides. A line is only scanned beyond the point where it was boarded before, so every route is
+        scanned at most once overall.
+
+        :param origin: stop_id to start from.
+        :param destination: stop_id to get to.
+        :return: List of (bus_id, boarding stop_id, leaving stop_id) rides, or None if destination is unreachable.
+        """
+        # stop_id -> (stop_id boarded at, bus_id) of the ride that first reached it.
+        parents = {origin: None}
+        # bus_id -> lowest position it was boarded at so far.
+        boarded = {}
+        frontier = [origin]
+        while frontier and destination not in parents:
+            next_frontier = []
+            for stop_id in frontier:
+                for bus_id in self.stop_lines.get(stop_id, ()):
+                    route = self.routes[bus_id]
+                    position = self.positions[bus_id][stop_id]
+                    end = boarded.get(bus_id, len(route))
+                    if position >= end:
+                        continue
+                    boarded[bus_id] = position
+                    for next_stop in route[position + 1:end]:
+                        if next_stop not in parents:
+                            parents[next_stop] = (stop_id, bus_id)
+                            next_frontier.append(next_stop)
+            frontier = next_frontier
+        if destination not in parents:
+            return None
+        rides = []
+        stop_id = destination
+        while parents[stop_id]:
+            boarding_stop, bus_id = parents[stop_id]
+            rides.append((bus_id, boarding_stop, stop_id))
+            stop_id = boarding_stop
+        return rides[::-1]
+
+    def print_reachable_stops(self, origin):
+        reachable = sorted(self.stop_names[stop_id] for stop_id in self.get_reachable_stops(origin))
+        print(f"Reachable from {self.stop_names.get(origin, origin)}: {len(reachable)} {reachable}")
+
+    def print_transfer_path(self, origin, destination):
+        origin_name = self.stop_names.get(origin, origin)
+        destination_name = self.stop_names.get(destination, destination)
+        rides = self.find_transfer_path(origin, destination)
+        if rides is None:
+            print(f"No path from {origin_name} to {destination_name}")
+            return
+        print(f"Path from {origin_name} to {destination_name}: {max(len(rides) - 1, 0)} transfer(s)")
+        for bus_id, boarding_stop, leaving_stop in rides:
+            print(f"bus_id: {bus_id}, {self.stop_names[boarding_stop]} -> {self.stop_names[leaving_stop]}")
+
+
+# Command line name of every analysis, in the order their reports are printed.
+ANALYSES = {
+    "format": FormatValidation,
+    "lines": BusLineInformation,
+    "stops": StopInformation,
+    "arrivals": BusArrivals,
+    "on_demand": OnDemandStops,
+    "routes": RouteGraph,
+}
+
+
+class EasyRider:
+    def __init__(self, json_data):
+        """
+        Parses through json_data and validates input data.
+        :param json_data: Company data from Easy Rider Bus Company in JSON format, or an iterable of stop dicts such
+        as a FeedReader. An iterable is consumed as the data is analyzed, so it can only be scanned once; use run() to
+        get several analyses out of that scan.
+        """
+        # Stops are converted to StopRecords once, here, and every analysis works on the records. Only a loaded feed
+        # is kept whole, so only its records share their ids, in a table that goes away with this instance.
+        if isinstance(json_data, str):
+            self.json_data = json.loads(json_data, object_hook=partial(StopRecord.from_dict, shared_ids={}))
+        else:
+            self.json_data = map(StopRecord.from_dict, json_data)
+
+    def scan(self, analyses: list) -> list:
+        """
+        Runs every analysis over a single scan of the data.
+
+        :param analyses: Analysis instances, e.g. [ANALYSES[name]() for name in names].
+        :return: analyses, holding their results.
+        """
+        adds = [analysis.add for analysis in analyses]
+        for stop in self.json_data:
+            for add in adds:
+                add(stop)
+        return analyses
+
+    def run(self, analyses: list) -> list:
+        """
+        Runs every analysis over a single scan of the data, then prints their reports in order.
+
+        :param analyses: Analysis instances, e.g. [ANALYSES[name]() for name in names].
+        :return: analyses, holding their results.
+        """
+        for analysis in self.scan(analyses):
+            analysis.report()
+        return analyses
+
+    def validate_input(self, engine: str = "columnar") -> FormatValidation:
+        return self.run([FormatValidation(engine)])[0]
+
+    def bus_line_information(self) -> BusLineInformation:
+        return self.run([BusLineInformation()])[0]
+
+    def stop_information(self) -> StopInformation:
+        return self.run([StopInformation()])[0]
+
+    def validate_bus_arrivals(self) -> BusArrivals:
+        return self.run([BusArrivals()])[0]
+
+    def validate_on_demand(self) -> OnDemandStops:
+        return self.run([OnDemandStops()])[0]
+
+    def route_graph(self) -> RouteGraph:
+        return self.run([RouteGraph()])[0]
+
+
+def find_feeds(directory: str) -> list:
+    """
+    :param directory: Directory holding one feed per company, as .json or .jsonl files.
+    :return: Sorted paths of the feeds.
+    """
+    return sorted(os.path.join(directory, filename) for filename in os.listdir(directory)
+                  if filename.endswith((".json", ".jsonl")))
+
+
+def analyze_feed(path: str) -> dict:
+    """
+    Worker entry point: streams one feed through every analysis in ANALYSES.
+
+    :param path: Feed to analyze.
+    :return: Dict with the feed path and the result() of every analysis, or the error that stopped reading the feed.
+    """
+    analyses = {name: analysis() for name, analysis in ANALYSES.items()}
+    try:
+        with open(path, 'r') as feed:
+            EasyRider(FeedReader(feed)).scan(list(analyses.values()))
+    except (OSError, ValueError, TypeError, AttributeError) as err:
+        # A feed that cannot be read should not stop the report on the others.
+        return {"feed": path, "error": f"{type(err).__name__}: {err}"}
+    report = {"feed": path}
+    for name, analysis in analyses.items():
+        try:
+            report[name] = analysis.result()
+        except (ValueError, TypeError) as err:
+            # Invalid data, such as bus_ids of different types that cannot be sorted, only fails this analysis.
+            report[name] = {"error": f"{type(err).__name__}: {err}"}
+    return report
+
+
+def analyze_feeds(paths: list, jobs: int = 1) -> list:
+    """
+    Analyzes every feed, in a process pool when jobs is above 1.
+
+    :param paths: Feeds to analyze.
+    :param jobs: Number of worker processes.
+    :return: Results of analyze_feed(), in the order of paths.
+    """
+    if jobs <= 1 or len(paths) <= 1:
+        return list(map(analyze_feed, paths))
+    with multiprocessing.Pool(min(jobs, len(paths))) as pool:
+        # One feed at a time, since a single feed can take much longer than the others.
+        return pool.map(analyze_feed, paths, chunksize=1)
+
 
-er = EasyRider(input())
-er.validate_on_demand()
\ No newline at end of file
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Validate and analyze Easy Rider Bus Company feeds.")
+    arg_parser.add_argument("feed",
+                            nargs="?",
+                            type=argparse.FileType('r'),
+                            help="Feed to stream, as a JSON array or JSON Lines, or - for stdin. "
+                                 "Without it a single line feed is read from stdin.")
+    arg_parser.add_argument("--check",
+                            nargs="+",
+                            choices=list(ANALYSES),
+                            default=["on_demand"],
+                            help="Analyses to run. They all share one scan of the feed.")
+    arg_parser.add_argument("--reachable",
+                            type=int,
+                            metavar="STOP_ID",
+                            help="List the stops that can be reached from this stop.")
+    arg_parser.add_argument("--path",
+                            type=int,
+                            nargs=2,
+                            metavar=("FROM_STOP_ID", "TO_STOP_ID"),
+                            help="Find the way between two stops with the fewest transfers.")
+    arg_parser.add_argument("--batch",
+                            metavar="DIRECTORY",
+                            help="Run every analysis on each .json and .jsonl feed in this directory and print one "
+                                 "JSON report for all of them.")
+    arg_parser.add_argument("--jobs",
+                            type=int,
+                            default=os.cpu_count(),
+                            help="Number of feeds analyzed in parallel in --batch mode.")
+    args = arg_parser.parse_args()
+    if args.batch:
+        json.dump({"feeds": analyze_feeds(find_feeds(args.batch), args.jobs)}, sys.stdout, indent=2)
+        print()
+        sys.exit()
+    if args.feed is None:
+        er = EasyRider(input())
+    else:
+        er = EasyRider(FeedReader(args.feed))
+    analyses = [ANALYSES[name]() for name in args.check]
+    if (args.reachable is not None or args.path) and "routes" not in args.check:
+        analyses.append(RouteGraph())
+    er.run(analyses)
+    route_graph = next((analysis for analysis in analyses if isinstance(analysis, RouteGraph)), None)
+    if args.reachable is not None:
+        route_graph.print_reachable_stops(args.reachable)
+    if args.path:
+        route_graph.print_transfer_path(*args.path)
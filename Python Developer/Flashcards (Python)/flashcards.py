@@ -59,6 +59,10 @@ class TerminalLogger:
 class FlashCards:
     def __init__(self, args: dict):
         self.card_dict = {}
+        # Reverse index of definition -> cards with it, kept in step with card_dict by set_card() and pop_card().
+        # An imported file may give several cards the same definition. The cards are the keys of a dict, in the order
+        # they were given the definition.
+        self.definition_dict = {}
         random.seed()
         self.memory_log = TerminalLogger()
         self.auto_import = args.get('import_from')
@@ -95,6 +99,37 @@ class FlashCards:
                 return
             self.memory_log.write()
 
+    def set_card(self, card: str, definition: str, mistakes: int = 0):
+        """
+        Adds a card or replaces an existing one, and updates the reverse index.
+        :param card: Term on the card.
+        :param definition: Definition of the card.
+        :param mistakes: Number of wrong answers given for the card.
+        """
+        if card in self.card_dict:
+            self.unindex_definition(card)
+        self.card_dict[card] = {"definition": definition,
+                                "mistakes": mistakes}
+        self.definition_dict.setdefault(definition, {})[card] = None
+
+    def pop_card(self, card: str) -> dict:
+        self.unindex_definition(card)
+        return self.card_dict.pop(card)
+
+    def unindex_definition(self, card: str):
+        definition = self.card_dict.get(card).get("definition")
+        cards = self.definition_dict.get(definition)
+        cards.pop(card, None)
+        if not cards:
+            del self.definition_dict[definition]
+
+    def find_card(self, definition: str) -> str:
+        """
+        :param definition: Definition of at least one card.
+        :return: The card that has had this definition the longest.
+        """
+        return next(iter(self.definition_dict.get(definition)))
+
     def add_card(self):
         self.memory_log.write("The card:")
         while True:
@@ -110,15 +145,13 @@ class FlashCards:
         while True:
             try:
                 definition = self.memory_log.read()
-                for key in self.card_dict.keys():
-                    if definition in self.card_dict.get(key).get("definition"):
-                        raise AddDuplicateDefinitionError(definition)
+                if definition in self.definition_dict:
+                    raise AddDuplicateDefinitionError(definition)
             except AddDuplicateDefinitionError as err:
                 self.memory_log.write(err)
             else:
                 break
-        self.card_dict[card] = {"definition": definition,
-                                "mistakes": 0}
+        self.set_card(card, definition)
         self.memory_log.write(f'''The pair ("{card}":"{definition}") has been added.''')
 
     def remove_card(self):
@@ -130,7 +163,7 @@ class FlashCards:
         except RemoveCardError as err:
             self.memory_log.write(err)
         else:
-            self.card_dict.pop(card)
+            self.pop_card(card)
             self.memory_log.write("The card has been removed.")
 
     def import_file(self, import_from: str = None):
@@ -144,8 +177,7 @@ class FlashCards:
             with open(import_file_name, "r", encoding="utf-8") as import_file:
                 for line in import_file:
                     line_split = re.split(r'\|', line)
-                    self.card_dict[line_split[0]] = {"definition": line_split[1],
-                                                     "mistakes": int(line_split[2])}
+                    self.set_card(line_split[0], line_split[1], int(line_split[2]))
                     n += 1
         except FileNotFoundError:
             self.memory_log.write("File not found.")
@@ -177,12 +209,9 @@ class FlashCards:
                     self.memory_log.write("Correct!")
                 else:
                     self.card_dict[card]["mistakes"] += 1
-                    for key in self.card_dict:
-                        if card_answer == self.card_dict.get(key).get("definition"):
-                            raise AskMismatchedGuessError(self.card_dict.get(card)
-                                                          .get("definition"),
-                                                          self.card_dict.get(key)
-                                                          .get("definition"))
+                    if card_answer in self.definition_dict:
+                        raise AskMismatchedGuessError(self.card_dict.get(card).get("definition"),
+                                                      self.find_card(card_answer))
                     else:
                         raise AskWrongAnswerError(self.card_dict.get(card).get("definition"))
             except (AskMismatchedGuessError, AskWrongAnswerError) as err:
@@ -0,0 +1,287 @@
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from main import SortingTool, parse_size
+
+
+COUNT_UNITS = {"K": 1000, "M": 1000 ** 2, "G": 1000 ** 3}
+DATA_TYPES = ['long', 'word', 'line']
+SORTING_TYPES = ['natural', 'byCount']
+DISTRIBUTIONS = ['uniform', 'zipf']
+# Every token is different, so a byCount report has as many keys as there are tokens.
+DISTINCT = 'distinct'
+# Number of distinct tokens the uniform and zipf generators draw from, and the Zipf exponent.
+VOCABULARY_SIZE = 100_000
+ZIPF_EXPONENT = 1.1
+# Tokens generated per random.choices() call and tokens written per input line for long and word data.
+GENERATE_BATCH_SIZE = 100_000
+TOKENS_PER_LINE = 10
+
+
+def parse_counts(value: str) -> list:
+    """
+    Converts a comma separated list of token counts such as "10K,1M,100M" into a list of ints.
+
+    :param value: Comma separated counts with an optional K/M/G suffix.
+    :return: List of counts.
+    """
+    counts = []
+    for item in value.upper().split(","):
+        try:
+            if item and item[-1] in COUNT_UNITS:
+                counts.append(int(float(item[:-1]) * COUNT_UNITS[item[-1]]))
+            else:
+                counts.append(int(item))
+        except ValueError:
+            raise argparse.ArgumentTypeError(f'"{item}" is not a valid token count.')
+    return counts
+
+
+def make_token(data_type: str, rank: int) -> str:
+    """
+    Maps a vocabulary rank to a token. Ranks are spread out so that sorted order does not follow frequency.
+
+    :param data_type: long, word or line.
+    :param rank: Position in the vocabulary.
+    :return: Token text.
+    """
+    spread = rank * 2654435761 % 2 ** 32
+    if data_type == 'long':
+        return str(spread - 2 ** 31)
+    word = ''
+    while True:
+        spread, letter = divmod(spread, 26)
+        word += chr(ord('a') + letter)
+        if not spread:
+            break
+    if data_type == 'word':
+        return word
+    return f"line of text {word}"
+
+
+def generate_input(path: str, data_type: str, distribution: str, size: int, seed: int = 0):
+    """
+    Writes size tokens to path. long and word tokens are written TOKENS_PER_LINE to a line, line tokens one per line.
+
+    :param path: Output file.
+    :param data_type: long, word or line.
+    :param distribution: uniform, zipf or distinct.
+    :param size: Number of tokens.
+    :param seed: Random seed, so that every run benchmarks the same input.
+    :return:
+    """
+    separator = "\n" if data_type == 'line' else " "
+    per_line = 1 if data_type == 'line' else TOKENS_PER_LINE
+    if distribution == DISTINCT:
+        # make_token() spreads ranks with a bijection, so every rank gives a different token.
+        with open(path, 'w') as outfile:
+            for start in range(0, size, per_line):
+                outfile.write(separator.join(make_token(data_type, rank)
+                                             for rank in range(start, min(start + per_line, size))))
+                outfile.write("\n")
+        return
+    rng = random.Random(seed)
+    vocabulary = [make_token(data_type, rank) for rank in range(min(VOCABULARY_SIZE, size))]
+    if distribution == 'zipf':
+        cum_weights = list(itertools.accumulate(1 / (rank + 1) ** ZIPF_EXPONENT for rank in range(len(vocabulary))))
+    else:
+        cum_weights = None
+    with open(path, 'w') as outfile:
+        remaining = size
+        while remaining > 0:
+            batch = rng.choices(vocabulary, cum_weights=cum_weights, k=min(GENERATE_BATCH_SIZE, remaining))
+            remaining -= len(batch)
+            for start in range(0, len(batch), per_line):
+                outfile.write(separator.join(batch[start:start + per_line]))
+                outfile.write("\n")
+
+
+def run_case(input_file: str, data_type: str, sorting_type: str, options: dict) -> dict:
+    """
+    Runs SortingTool once. Meant to run in a fresh process so that the peak RSS belongs to this case only.
+
+    :return: Elapsed seconds, per-phase seconds and peak RSS in KiB.
+    """
+    start = time.perf_counter()
+    tool = SortingTool(data_type=data_type,
+                       sorting_type=sorting_type,
+                       input_file=input_file,
+                       output_file=os.devnull,
+                       **options)
+    seconds = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # macOS reports bytes, Linux reports KiB.
+        peak_rss //= 1024
+    return {"seconds": seconds,
+            "phases": dict(tool.timings),
+            "peak_rss_kib": peak_rss}
+
+
+class Benchmark:
+    def __init__(self, sizes: list, data_types: list, sorting_types: list, distributions: list, options: dict,
+                 data_dir: str = None):
+        self.sizes = sizes
+        self.data_types = data_types
+        self.sorting_types = sorting_types
+        self.distributions = distributions
+        self.options = options
+        self.data_dir = data_dir
+        self.results = []
+
+    def run(self) -> dict:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            data_dir = self.data_dir or temp_dir
+            for data_type, distribution, size in itertools.product(self.data_types, self.distributions, self.sizes):
+                input_file = os.path.join(data_dir, f"{data_type}-{distribution}-{size}.txt")
+                if not os.path.exists(input_file):
+                    generate_input(input_file, data_type, distribution, size)
+                for sorting_type in self.sorting_types:
+                    self.results.append(self.run_one(input_file, data_type, sorting_type, distribution, size))
+        return {"python": platform.python_version(),
+                "platform": platform.platform(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "options": self.options,
+                "results": self.results}
+
+    def run_one(self, input_file: str, data_type: str, sorting_type: str, distribution: str, size: int) -> dict:
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            measured = executor.submit(run_case, input_file, data_type, sorting_type, self.options).result()
+        result = {"data_type": data_type,
+                  "sorting_type": sorting_type,
+                  "distribution": distribution,
+                  "size": size,
+                  "tokens_per_second": size / measured["seconds"] if measured["seconds"] else None,
+                  **measured}
+        print(f"{data_type:>5} {sorting_type:>8} {distribution:>8} {size:>11,}: "
+              f"{measured['seconds']:8.3f}s {result['tokens_per_second'] or 0:14,.0f} tokens/s "
+              f"{measured['peak_rss_kib'] / 1024:9.1f} MiB "
+              + " ".join(f"{name}={seconds:.3f}s" for name, seconds in measured["phases"].items()))
+        return result
+
+
+def case_key(result: dict) -> tuple:
+    return result["data_type"], result["sorting_type"], result["distribution"], result["size"]
+
+
+def scaling_exponents(results: dict) -> list:
+    """
+    Estimates how run time grows with input size: for every pair of consecutive sizes of the same case, the exponent
+    k in seconds ~ size ** k. Linear scaling gives about 1, quadratic about 2.
+
+    :param results: Output of Benchmark.run().
+    :return: List of (case description, smaller size, larger size, exponent).
+    """
+    cases = {}
+    for result in results["results"]:
+        case = (result["data_type"], result["sorting_type"], result["distribution"])
+        cases.setdefault(case, []).append((result["size"], result["seconds"]))
+    exponents = []
+    for case, measured in cases.items():
+        measured.sort()
+        for (small, small_seconds), (large, large_seconds) in zip(measured, measured[1:]):
+            if small < large and small_seconds > 0 and large_seconds > 0:
+                exponent = math.log(large_seconds / small_seconds) / math.log(large / small)
+                exponents.append((" ".join(case), small, large, exponent))
+    return exponents
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Finds cases that got slower or use more memory than in baseline by more than tolerance.
+
+    :param results: Output of Benchmark.run().
+    :param baseline: Output of an earlier Benchmark.run().
+    :param tolerance: Allowed relative increase, e.g. 0.2 for 20%.
+    :return: List of regression messages.
+    """
+    previous = {case_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results["results"]:
+        old = previous.get(case_key(result))
+        if old is None:
+            continue
+        for metric in ("seconds", "peak_rss_kib"):
+            if result[metric] > old[metric] * (1 + tolerance):
+                regressions.append(f"{' '.join(map(str, case_key(result)))}: {metric} "
+                                   f"{old[metric]:.3f} -> {result[metric]:.3f}")
+    return regressions
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmark SortingTool on generated inputs.")
+    arg_parser.add_argument('-sizes',
+                            type=parse_counts,
+                            default=parse_counts("10K,100K,1M"),
+                            help="Comma separated token counts, e.g. 10K,1M,100M.")
+    arg_parser.add_argument('-dataTypes',
+                            type=lambda value: value.split(","),
+                            default=DATA_TYPES)
+    arg_parser.add_argument('-sortingTypes',
+                            type=lambda value: value.split(","),
+                            default=SORTING_TYPES)
+    arg_parser.add_argument('-distributions',
+                            type=lambda value: value.split(","),
+                            default=DISTRIBUTIONS,
+                            help=f"Comma separated, from {', '.join(DISTRIBUTIONS + [DISTINCT])}. "
+                                 f"{DISTINCT} makes every token unique, e.g. "
+                                 f"-sortingTypes byCount -distributions {DISTINCT} -sizes 100K,1M "
+                                 f"checks that byCount scales linearly up to 1M keys.")
+    arg_parser.add_argument('-dataDir',
+                            help="Directory used to keep generated inputs between runs.")
+    arg_parser.add_argument('-output',
+                            default="benchmark.json",
+                            help="JSON file the results are written to.")
+    arg_parser.add_argument('-baseline',
+                            help="Earlier results to check for regressions.")
+    arg_parser.add_argument('-tolerance',
+                            type=float,
+                            default=0.2,
+                            help="Allowed relative slowdown or memory growth against -baseline.")
+    arg_parser.add_argument('-maxScalingExponent',
+                            type=float,
+                            help="Fail when run time grows faster than size ** this between two sizes, e.g. 1.3.")
+    arg_parser.add_argument('-memoryLimit', type=parse_size)
+    arg_parser.add_argument('-workers', type=int, default=1)
+    arg_parser.add_argument('-engine', choices=['python', 'numpy'], default='python')
+    args = arg_parser.parse_args()
+
+    benchmark = Benchmark(sizes=args.sizes,
+                          data_types=args.dataTypes,
+                          sorting_types=args.sortingTypes,
+                          distributions=args.distributions,
+                          options={"memory_limit": args.memoryLimit,
+                                   "workers": args.workers,
+                                   "engine": args.engine},
+                          data_dir=args.dataDir)
+    results = benchmark.run()
+    with open(args.output, 'w') as outfile:
+        json.dump(results, outfile, indent=2)
+    print(f"Results saved to {args.output}.")
+    too_slow = False
+    for case, small, large, exponent in scaling_exponents(results):
+        print(f"Scaling {case} {small:,} -> {large:,}: time ~ size ** {exponent:.2f}")
+        if args.maxScalingExponent is not None and exponent > args.maxScalingExponent:
+            too_slow = True
+    if args.baseline:
+        with open(args.baseline, 'r') as infile:
+            regressions = compare(results, json.load(infile), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+    if too_slow:
+        print(f"Run time grew faster than size ** {args.maxScalingExponent}.")
+        sys.exit(1)
@@ -1,25 +1,639 @@
 import argparse
+import hashlib
+import heapq
+import itertools
+import locale
+import math
+import multiprocessing
+import operator
+import os
+import random
+import sys
+import tempfile
+import time
 
+from array import array
 from collections import defaultdict
+from contextlib import contextmanager
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+MEMORY_UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+# Maximum number of sorted runs merged at once. More runs than this are merged in several passes so that we never
+# hold too many temporary files open.
+MERGE_FAN_IN = 64
+# Number of bytes each worker reads at a time when counting a byte range of the input file.
+READ_CHUNK_SIZE = 16 * 1024 ** 2
+# Number of tokens converted by NumPy at once. A chunk containing an invalid token is re-parsed one token at a time.
+NUMPY_CHUNK_SIZE = 64 * 1024
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+DEFAULT_BUFFER_SIZE = 1024 ** 2
+# Number of items joined into a single str at a time when writing the sorted data.
+JOIN_BATCH_SIZE = 4096
+# Defaults for -approximate: Count-Min Sketch error as a fraction of the total, probability that the error bound
+# holds, HyperLogLog precision (2 ** precision registers) and number of most frequent items reported.
+DEFAULT_ERROR_RATE = 0.001
+DEFAULT_CONFIDENCE = 0.99
+DEFAULT_HLL_PRECISION = 14
+DEFAULT_APPROXIMATE_TOP = 10
+
+
+def parse_size(value: str) -> int:
+    """
+    Converts a size such as "256M", "64K" or "1G" into a number of bytes.
+
+    :param value: Size with an optional K/M/G suffix.
+    :return: Size in bytes.
+    """
+    value = value.strip().upper().removesuffix("B")
+    try:
+        if value and value[-1] in MEMORY_UNITS:
+            limit = int(value[:-1]) * MEMORY_UNITS[value[-1]]
+        else:
+            limit = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'"{value}" is not a valid size.')
+    if limit <= 0:
+        raise argparse.ArgumentTypeError("The size must be positive.")
+    return limit
+
+
+def positive_int(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'"{value}" is not a valid number.')
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f'"{value}" must be positive.')
+    return number
+
+
+def probability(value: str) -> float:
+    try:
+        number = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'"{value}" is not a valid number.')
+    if not 0 < number < 1:
+        raise argparse.ArgumentTypeError(f'"{value}" must be between 0 and 1.')
+    return number
+
+
+def hll_precision(value: str) -> int:
+    try:
+        precision = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'"{value}" is not a valid number.')
+    if not 4 <= precision <= 18:
+        raise argparse.ArgumentTypeError(f'"{value}" must be between 4 and 18.')
+    return precision
+
+
+def parse_percentiles(value: str) -> list:
+    """
+    Converts a comma separated list of percentiles such as "50,90,99.9" into a list of floats.
+
+    :param value: Comma separated percentiles between 0 and 100.
+    :return: List of percentiles.
+    """
+    try:
+        percentiles = [float(item) for item in value.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'"{value}" is not a valid list of percentiles.')
+    for percentile in percentiles:
+        if not 0 <= percentile <= 100:
+            raise argparse.ArgumentTypeError(f'"{percentile:g}" is not between 0 and 100.')
+    return percentiles
+
+
+def percentile_rank(percentile: float, total: int) -> int:
+    """
+    Nearest-rank method: the 1-based position of a percentile in total sorted values.
+
+    :param percentile: Percentile between 0 and 100.
+    :param total: Number of values.
+    :return: Position between 1 and total.
+    """
+    return min(total, max(1, math.ceil(percentile / 100 * total)))
+
+
+def weighted_select(items: list, rank: int):
+    """
+    Quickselect over (key, count) pairs. Returns the key found at position rank if every key were repeated count
+    times and sorted, in linear expected time.
+
+    :param items: List of (key, count) tuples with distinct keys.
+    :param rank: 1-based position, at most the sum of the counts.
+    :return: Key at that position.
+    """
+    while True:
+        pivot, pivot_count = random.choice(items)
+        lower = [item for item in items if item[0] < pivot]
+        lower_count = sum(v for _, v in lower)
+        if rank <= lower_count:
+            items = lower
+        elif rank <= lower_count + pivot_count:
+            return pivot
+        else:
+            rank -= lower_count + pivot_count
+            items = [item for item in items if item[0] > pivot]
+
+
+def record_size(record) -> int:
+    """
+    Estimates the memory held by a record buffered in a list, including the list slot pointing to it.
+
+    :param record: int, str or tuple of ints and strs.
+    :return: Approximate size in bytes.
+    """
+    size = sys.getsizeof(record) + 8
+    if isinstance(record, tuple):
+        size += sum(sys.getsizeof(item) for item in record)
+    return size
+
+
+def hash_item(item) -> tuple:
+    """
+    Hashes an item into two independent 64-bit ints. Unlike hash(), the result is the same on every run, so
+    approximate reports are reproducible.
+
+    :param item: int or str.
+    :return: Tuple of two 64-bit ints.
+    """
+    digest = hashlib.blake2b(str(item).encode("utf-8", "surrogatepass"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
+
+
+class CountMinSketch:
+    """
+    Fixed size frequency table. Estimates never undercount and overcount by at most error_rate * total with
+    probability confidence.
+    """
+    def __init__(self, error_rate: float = DEFAULT_ERROR_RATE, confidence: float = DEFAULT_CONFIDENCE):
+        self.width = math.ceil(math.e / error_rate)
+        self.depth = math.ceil(math.log(1 / (1 - confidence)))
+        self.tables = [array('Q', bytes(8 * self.width)) for _ in range(self.depth)]
+
+    def add(self, hashes: tuple, count: int = 1) -> int:
+        """
+        Adds count occurrences of an item.
+
+        :param hashes: Hashes of the item from hash_item().
+        :param count: Number of occurrences to add.
+        :return: Estimated count of the item after adding.
+        """
+        first, second = hashes
+        estimate = None
+        for row, table in enumerate(self.tables):
+            # Double hashing gives depth independent enough columns from two hashes.
+            column = (first + row * second) % self.width
+            table[column] += count
+            if estimate is None or table[column] < estimate:
+                estimate = table[column]
+        return estimate
+
+    def estimate(self, hashes: tuple) -> int:
+        first, second = hashes
+        return min(table[(first + row * second) % self.width] for row, table in enumerate(self.tables))
+
+
+class HyperLogLog:
+    """
+    Fixed size distinct counter with a relative standard error of about 1.04 / sqrt(2 ** precision).
+    """
+    def __init__(self, precision: int = DEFAULT_HLL_PRECISION):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(self.size)
+
+    def add(self, hashes: tuple):
+        value = hashes[0]
+        register = value >> (64 - self.precision)
+        remaining_bits = 64 - self.precision
+        rank = remaining_bits - (value & ((1 << remaining_bits) - 1)).bit_length() + 1
+        if rank > self.registers[register]:
+            self.registers[register] = rank
+
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size ** 2 / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.size and zeros:
+            # Small range correction: linear counting is more accurate while many registers are still empty.
+            estimate = self.size * math.log(self.size / zeros)
+        return round(estimate)
+
+
+class OutputWriter:
+    """
+    Collects output text and writes it to the underlying stream in blocks of about buffer_size characters, so that
+    each result line does not cost its own write call.
+    """
+    def __init__(self, stream, buffer_size: int = DEFAULT_BUFFER_SIZE):
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.parts = []
+        self.size = 0
+
+    def write(self, text: str):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def write_line(self, line: str):
+        self.write(f"{line}\n")
+
+    def write_joined(self, header: str, items, separator: str):
+        """
+        Writes header followed by items joined with separator and a newline. Items are joined JOIN_BATCH_SIZE at a
+        time, so the full joined str is never built in memory.
+
+        :param header: Text written before the first item.
+        :param items: Iterable of strs.
+        :param separator: Text written between items.
+        :return:
+        """
+        self.write(header)
+        items = iter(items)
+        batch = list(itertools.islice(items, JOIN_BATCH_SIZE))
+        while batch:
+            self.write(separator.join(batch))
+            batch = list(itertools.islice(items, JOIN_BATCH_SIZE))
+            if batch:
+                self.write(separator)
+        self.write("\n")
+
+    def flush(self):
+        if self.parts:
+            self.stream.write(''.join(self.parts))
+            self.parts = []
+            self.size = 0
+        self.stream.flush()
+
+
+class ExternalSorter:
+    """
+    Sorts a stream of records that may not fit in memory.
+    Records are buffered until memory_limit is reached, then sorted and spilled to a temporary file as a run. Once
+    every record has been added, the runs are k-way merged back into a single sorted stream.
+    """
+    def __init__(self, memory_limit: int, encode=str, decode=str):
+        """
+        :param memory_limit: Approximate number of bytes of records to buffer before spilling a run.
+        :param encode: Converts a record into a single line of text (without the newline).
+        :param decode: Converts a line of text (without the newline) back into a record.
+        """
+        self.memory_limit = memory_limit
+        self.encode = encode
+        self.decode = decode
+        self.buffer = []
+        self.buffer_size = 0
+        self.runs = []
+
+    def add(self, record):
+        self.buffer.append(record)
+        self.buffer_size += record_size(record)
+        if self.buffer_size >= self.memory_limit:
+            self.spill()
+
+    def extend(self, records):
+        for record in records:
+            self.add(record)
+
+    def spill(self):
+        """
+        Sorts the buffered records and writes them to a new run.
+
+        :return:
+        """
+        self.buffer.sort()
+        self.runs.append(self.write_run(self.buffer))
+        self.buffer = []
+        self.buffer_size = 0
+
+    def write_run(self, records):
+        # newline='\n' keeps carriage returns and other line breaking characters inside records intact.
+        run = tempfile.TemporaryFile(mode="w+", encoding="utf-8", newline="\n")
+        encode = self.encode
+        run.writelines(f"{encode(record)}\n" for record in records)
+        run.seek(0)
+        return run
+
+    def read_run(self, run):
+        decode = self.decode
+        for line in run:
+            yield decode(line[:-1])
+
+    def merge(self):
+        """
+        Yields every record added so far in sorted order. When nothing was spilled the buffer is sorted in memory.
+
+        :return: Iterator over the sorted records.
+        """
+        if not self.runs:
+            self.buffer.sort()
+            yield from self.buffer
+            self.buffer = []
+            return
+        if self.buffer:
+            self.spill()
+        try:
+            while len(self.runs) > MERGE_FAN_IN:
+                merging, self.runs = self.runs[:MERGE_FAN_IN], self.runs[MERGE_FAN_IN:]
+                self.runs.append(self.write_run(heapq.merge(*map(self.read_run, merging))))
+                for run in merging:
+                    run.close()
+            yield from heapq.merge(*map(self.read_run, self.runs))
+        finally:
+            self.close()
+
+    def close(self):
+        for run in self.runs:
+            run.close()
+        self.runs = []
+
+
+def group_sorted(records, key=None):
+    """
+    Collapses a sorted stream into (count, first record) pairs for each run of equal keys.
+
+    :param records: Sorted iterable.
+    :param key: Optional key function used to compare records.
+    :return: Iterator over (count, first record) tuples.
+    """
+    for _, group in itertools.groupby(records, key=key):
+        first = next(group)
+        yield 1 + sum(1 for _ in group), first
+
+
+def repeat_items(items):
+    """
+    Expands (item, count) pairs into each item repeated count times.
+
+    :param items: Iterable of (item, count) tuples.
+    :return: Iterator over the repeated items.
+    """
+    return itertools.chain.from_iterable(itertools.repeat(k, v) for k, v in items)
+
+
+def encode_pair(record: tuple) -> str:
+    return f"{record[0]} {record[1]}"
+
+
+def decode_int_pair(text: str) -> tuple:
+    first, second = text.split(" ", 1)
+    return int(first), int(second)
+
+
+def decode_str_pair(text: str) -> tuple:
+    first, second = text.split(" ", 1)
+    return int(first), second
+
+
+def encode_word_index(record: tuple) -> str:
+    return f"{record[0]} {record[1]}"
+
+
+def decode_word_index(text: str) -> tuple:
+    word, index = text.split(" ")
+    return word, int(index)
+
+
+def encode_count_index_word(record: tuple) -> str:
+    return f"{record[0]} {record[1]} {record[2]}"
+
+
+def decode_count_index_word(text: str) -> tuple:
+    count, index, word = text.split(" ")
+    return int(count), int(index), word
+
+
+def count_longs(lines) -> tuple:
+    """
+    Counts every whitespace separated int found in lines.
+
+    :param lines: Iterable of strs, either single lines or larger blocks of text.
+    :return: Tuple of the counts keyed by int and a list of tokens that are not ints, in input order.
+    """
+    int_dict = defaultdict(int)
+    skipped = []
+    for line in lines:
+        for line_int in line.split():
+            try:
+                int_dict[int(line_int)] += 1
+            except ValueError:
+                skipped.append(line_int)
+    return int_dict, skipped
+
+
+def count_words(lines) -> tuple:
+    """
+    Counts every whitespace separated word found in lines. Words are kept in order of first appearance.
+
+    :param lines: Iterable of strs, either single lines or larger blocks of text.
+    :return: Tuple of the counts keyed by word and an empty list of skipped tokens.
+    """
+    word_dict = defaultdict(int)
+    for line in lines:
+        for line_word in line.split():
+            word_dict[line_word] += 1
+    return word_dict, []
+
+
+def count_lines(lines) -> tuple:
+    """
+    Counts every line after stripping trailing white space.
+
+    :param lines: Iterable of lines.
+    :return: Tuple of the counts keyed by line and an empty list of skipped tokens.
+    """
+    line_dict = defaultdict(int)
+    for line in lines:
+        line_dict[line.rstrip()] += 1
+    return line_dict, []
+
+
+def parse_longs_numpy(tokens: list) -> tuple | None:
+    """
+    Converts tokens into an int64 array in bulk. Chunks that fail to convert fall back to int() per token so that
+    invalid tokens can be reported in input order.
+
+    :param tokens: List of strs.
+    :return: Tuple of the int64 array and a list of tokens that are not ints, or None when a value does not fit in
+    an int64.
+    """
+    arrays = []
+    skipped = []
+    for start in range(0, len(tokens), NUMPY_CHUNK_SIZE):
+        chunk = tokens[start:start + NUMPY_CHUNK_SIZE]
+        try:
+            arrays.append(np.array(chunk, dtype=np.int64))
+        except (ValueError, OverflowError):
+            values = []
+            for token in chunk:
+                try:
+                    value = int(token)
+                except ValueError:
+                    skipped.append(token)
+                    continue
+                if not INT64_MIN <= value <= INT64_MAX:
+                    return None
+                values.append(value)
+            arrays.append(np.array(values, dtype=np.int64))
+    if not arrays:
+        return np.empty(0, dtype=np.int64), skipped
+    return np.concatenate(arrays), skipped
+
+
+COUNTERS = {"long": count_longs, "word": count_words, "line": count_lines}
+
+
+def split_byte_ranges(path: str, parts: int) -> list:
+    """
+    Splits a file into at most parts byte ranges that each start at the beginning of a line.
+
+    :param path: Path of the file to split.
+    :param parts: Number of ranges wanted.
+    :return: List of (start, end) tuples covering the whole file.
+    """
+    size = os.path.getsize(path)
+    boundaries = [0]
+    with open(path, 'rb') as infile:
+        for n in range(1, parts):
+            infile.seek(max(size * n // parts, boundaries[-1]))
+            infile.readline()
+            position = infile.tell()
+            if position >= size:
+                break
+            if position > boundaries[-1]:
+                boundaries.append(position)
+    boundaries.append(size)
+    return list(zip(boundaries, boundaries[1:]))
+
+
+def read_byte_range(path: str, start: int, end: int):
+    """
+    Yields the text between start and end of a file in blocks of roughly READ_CHUNK_SIZE bytes that always end on a
+    line boundary. The file is decoded with the same default encoding used by open().
+
+    :param path: Path of the file to read.
+    :param start: Byte offset of the first line.
+    :param end: Byte offset just past the last line.
+    :return: Iterator over blocks of text.
+    """
+    encoding = locale.getpreferredencoding(False)
+    with open(path, 'rb') as infile:
+        infile.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = infile.read(min(READ_CHUNK_SIZE, remaining))
+            remaining -= len(block)
+            if remaining > 0 and not block.endswith(b"\n"):
+                tail = infile.readline(remaining)
+                remaining -= len(tail)
+                block += tail
+            if not block:
+                break
+            yield block.decode(encoding)
+
+
+def split_lines(blocks):
+    """
+    Splits blocks of text into lines the same way a file opened in text mode does, treating "\\n", "\\r\\n" and
+    "\\r" as line endings.
+
+    :param blocks: Iterable of strs that each end on a line boundary.
+    :return: Iterator over lines without line endings.
+    """
+    for block in blocks:
+        if "\r" in block:
+            block = block.replace("\r\n", "\n").replace("\r", "\n")
+        lines = block.split("\n")
+        if lines[-1] == "":
+            lines.pop()
+        yield from lines
+
+
+def count_byte_range(path: str, start: int, end: int, data_type: str) -> tuple:
+    """
+    Worker entry point for SortingTool.count_parallel().
+
+    :return: Same tuple as the counter for data_type.
+    """
+    blocks = read_byte_range(path, start, end)
+    if data_type == "line":
+        blocks = split_lines(blocks)
+    return COUNTERS[data_type](blocks)
 
 
 class SortingTool:
-    def __init__(self, data_type: str, sorting_type: str, input_file: str, output_file: str):
+    def __init__(self, data_type: str, sorting_type: str, input_file: str, output_file: str,
+                 memory_limit: int = None, workers: int = 1, engine: str = 'python',
+                 buffer_size: int = DEFAULT_BUFFER_SIZE, top: int = None, bottom: int = None,
+                 percentiles: list = None, approximate: bool = False, error_rate: float = DEFAULT_ERROR_RATE,
+                 confidence: float = DEFAULT_CONFIDENCE, precision: int = DEFAULT_HLL_PRECISION):
         self.data_type = data_type
         self.sorting_type = sorting_type
         self.input_file = input_file
         self.output_file = open(output_file, 'w') if output_file else output_file
+        self.writer = OutputWriter(self.output_file if self.output_file else sys.stdout, buffer_size)
+        self.memory_limit = memory_limit
+        self.top = top
+        self.bottom = bottom
+        self.percentiles = percentiles
+        self.approximate = approximate
+        self.error_rate = error_rate
+        self.confidence = confidence
+        self.precision = precision
+        self.engine = engine if np is not None else 'python'
+        # Only a named input file can be split into byte ranges for the workers.
+        # The NumPy engine parses longs from memory, so it reads the input in this process.
+        if not input_file or (self.engine == 'numpy' and data_type == 'long'):
+            workers = 1
+        self.workers = workers
         self.lines = []
-        self.read_input()
-        if self.data_type == 'word':
-            self.parse_word()
-        elif self.data_type == "long":
-            self.parse_long()
+        # Seconds spent in each phase (read, parse, sort, merge, write), used by benchmark.py.
+        self.timings = defaultdict(float)
+        if self.approximate:
+            self.parse_approximate()
+        elif self.memory_limit:
+            self.parse_external()
         else:
-            self.parse_line()
+            if self.workers <= 1:
+                with self.phase("read"):
+                    self.read_input()
+            if self.data_type == 'word':
+                self.parse_word()
+            elif self.data_type == "long" and self.engine == 'numpy':
+                self.parse_long_numpy()
+            elif self.data_type == "long":
+                self.parse_long()
+            else:
+                self.parse_line()
+        with self.phase("write"):
+            self.writer.flush()
         if self.output_file:
             self.output_file.close()
 
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Adds the time spent in the with block to self.timings[name].
+
+        :param name: Phase name.
+        :return:
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.perf_counter() - start
+
     def read_input(self):
         if self.input_file:
             with open(self.input_file, 'r') as infile:
@@ -31,11 +645,248 @@ class SortingTool:
                 except EOFError:
                     break
 
+    def iter_input(self):
+        """
+        Yields input lines one at a time instead of loading the whole input like read_input().
+
+        :return: Iterator over input lines.
+        """
+        if self.input_file:
+            with open(self.input_file, 'r') as infile:
+                yield from infile
+        else:
+            yield from sys.stdin
+
+    def count_tokens(self) -> tuple:
+        """
+        Counts the input with the counter for self.data_type, splitting the work across processes when
+        self.workers is above 1.
+
+        :return: Tuple of the counts and a list of skipped tokens.
+        """
+        if self.workers <= 1:
+            return COUNTERS[self.data_type](self.lines)
+        return self.count_parallel()
+
+    def count_parallel(self) -> tuple:
+        """
+        Splits the input file into byte ranges on line boundaries, counts each range in a process pool and merges the
+        results. Ranges are merged in file order, so keys keep their order of first appearance and skipped tokens are
+        reported in input order.
+
+        :return: Tuple of the counts and a list of skipped tokens.
+        """
+        ranges = split_byte_ranges(self.input_file, self.workers)
+        counts = defaultdict(int)
+        skipped = []
+        with multiprocessing.Pool(min(self.workers, len(ranges))) as pool:
+            results = pool.starmap(count_byte_range,
+                                   [(self.input_file, start, end, self.data_type) for start, end in ranges])
+        for range_counts, range_skipped in results:
+            for k, v in range_counts.items():
+                counts[k] += v
+            skipped.extend(range_skipped)
+        return counts, skipped
+
     def write_output(self, line: str):
-        if self.output_file:
-            self.output_file.write(f"{line}\n")
+        self.writer.write_line(line)
+
+    def write_items(self, header: str, items, separator: str):
+        self.writer.write_joined(header, items, separator)
+
+    def iter_longs(self):
+        for line in self.iter_input():
+            for line_int in line.split():
+                try:
+                    yield int(line_int)
+                except ValueError:
+                    print(f'"{line_int}" is not a long. It will be skipped.')
+
+    def iter_words(self):
+        for line in self.iter_input():
+            yield from line.split()
+
+    def iter_lines(self):
+        for line in self.iter_input():
+            yield line.rstrip()
+
+    def parse_approximate(self):
+        """
+        Streams the input through a CountMinSketch for frequencies and a HyperLogLog for distinct items, so memory
+        stays fixed no matter how many distinct items there are. Only the self.top (DEFAULT_APPROXIMATE_TOP by
+        default) items with the highest estimated counts are kept and reported in the byCount format.
+
+        :return:
+        """
+        if self.data_type == 'long':
+            label, tokens = "numbers", self.iter_longs()
+        elif self.data_type == 'word':
+            label, tokens = "words", self.iter_words()
         else:
-            print(line)
+            label, tokens = "lines", self.iter_lines()
+        top = self.top or DEFAULT_APPROXIMATE_TOP
+        sketch = CountMinSketch(self.error_rate, self.confidence)
+        distinct = HyperLogLog(self.precision)
+        candidates = {}
+        min_key, min_estimate = None, 0
+        total = 0
+        parse_start = time.perf_counter()
+        for token in tokens:
+            total += 1
+            hashes = hash_item(token)
+            distinct.add(hashes)
+            estimate = sketch.add(hashes)
+            if token in candidates:
+                candidates[token] = estimate
+                if token != min_key:
+                    continue
+            elif len(candidates) < top:
+                candidates[token] = estimate
+            elif estimate > min_estimate:
+                del candidates[min_key]
+                candidates[token] = estimate
+            else:
+                continue
+            min_key, min_estimate = min(candidates.items(), key=operator.itemgetter(1))
+        self.timings["parse"] += time.perf_counter() - parse_start
+        with self.phase("write"):
+            self.write_output(f"Total {label}: {total}.")
+            self.write_output(f"Distinct {label} (estimated): {distinct.count()}.")
+            self.write_output(f"Top {top}:")
+            self.write_by_count(heapq.nlargest(top, candidates.items(), key=operator.itemgetter(1, 0)), total)
+
+    def parse_external(self):
+        """
+        Streams the input through ExternalSorter so that memory use stays around self.memory_limit regardless of the
+        input size. Output is identical to parse_long(), parse_word() and parse_line().
+        For byCount and for natural sorting of words, the sorted tokens are collapsed into (count, token) records,
+        which are then sorted a second time by count.
+
+        :return:
+        """
+        if self.data_type == 'long':
+            label, tokens = "numbers", self.iter_longs()
+            sorter = ExternalSorter(self.memory_limit, decode=int)
+            decode_pair = decode_int_pair
+        elif self.data_type == 'word':
+            label = "words"
+            if self.sorting_type == 'natural':
+                # Keep the position of each word so that words with equal counts stay in order of first appearance.
+                tokens = ((word, n) for n, word in enumerate(self.iter_words()))
+                sorter = ExternalSorter(self.memory_limit, encode=encode_word_index, decode=decode_word_index)
+            else:
+                tokens = self.iter_words()
+                sorter = ExternalSorter(self.memory_limit)
+            decode_pair = decode_str_pair
+        else:
+            label, tokens = "lines", self.iter_lines()
+            sorter = ExternalSorter(self.memory_limit)
+            decode_pair = decode_str_pair
+
+        total = 0
+        with self.phase("parse"):
+            for token in tokens:
+                sorter.add(token)
+                total += 1
+        self.write_output(f"Total {label}: {total}.")
+
+        # Merging is lazy, so the merge phase also includes writing the output.
+        with self.phase("merge"):
+            self.write_external(sorter, total, decode_pair)
+
+    def write_external(self, sorter: ExternalSorter, total: int, decode_pair):
+        """
+        Merges the runs filled by parse_external() and writes the natural or byCount output.
+
+        :param sorter: ExternalSorter holding every token.
+        :param total: Number of tokens.
+        :param decode_pair: Decoder for (count, token) records.
+        :return:
+        """
+        if self.sorting_type == 'natural' and self.data_type == 'word':
+            by_count = ExternalSorter(self.memory_limit, encode=encode_count_index_word,
+                                      decode=decode_count_index_word)
+            by_count.extend((count, index, word)
+                            for count, (word, index) in group_sorted(sorter.merge(), key=lambda item: item[0]))
+            self.write_items("Sorted data: ",
+                             repeat_items((word, count) for count, _, word in by_count.merge()),
+                             " ")
+        elif self.sorting_type == 'natural':
+            if self.data_type == 'long':
+                self.write_items("Sorted data: ", map(str, sorter.merge()), " ")
+            else:
+                self.write_items("Sorted data:\n", sorter.merge(), "\n")
+        else:
+            by_count = ExternalSorter(self.memory_limit, encode=encode_pair, decode=decode_pair)
+            by_count.extend(group_sorted(sorter.merge()))
+            self.write_by_count(((k, v) for v, k in by_count.merge()), total)
+
+    def has_queries(self) -> bool:
+        return bool(self.top or self.bottom or self.percentiles)
+
+    def report_queries(self, counts: dict, total: int):
+        """
+        Writes the -top, -bottom and -percentiles reports in place of the sorted output.
+
+        :param counts: Occurrences keyed by int, word or line.
+        :param total: Sum of all occurrences.
+        :return:
+        """
+        self.write_top_bottom(counts, total)
+        if self.percentiles and total:
+            items = list(counts.items())
+            self.write_percentiles((percentile, weighted_select(items, percentile_rank(percentile, total)))
+                                   for percentile in self.percentiles)
+
+    def write_top_bottom(self, counts: dict, total: int):
+        """
+        Selects the most and least frequent keys with a heap instead of sorting every key. Ties are broken by key
+        like the byCount report.
+
+        :param counts: Occurrences keyed by int, word or line.
+        :param total: Sum of all occurrences.
+        :return:
+        """
+        if self.top:
+            self.write_output(f"Top {self.top}:")
+            self.write_by_count(heapq.nlargest(self.top, counts.items(), key=operator.itemgetter(1, 0)), total)
+        if self.bottom:
+            self.write_output(f"Bottom {self.bottom}:")
+            self.write_by_count(heapq.nsmallest(self.bottom, counts.items(), key=operator.itemgetter(1, 0)), total)
+
+    def write_percentiles(self, items):
+        """
+        :param items: Iterable of (percentile, value) tuples.
+        :return:
+        """
+        self.write_output("Percentiles:")
+        for percentile, value in items:
+            self.write_output(f"{percentile:g}%: {value}")
+
+    def report_by_count(self, counts: dict, total: int):
+        """
+        Shared byCount report for every data type. Sorts the counts once by count, then by key, and writes them.
+
+        :param counts: Occurrences keyed by int, word or line.
+        :param total: Sum of all occurrences.
+        :return:
+        """
+        with self.phase("sort"):
+            sorted_counts = sorted(counts.items(), key=operator.itemgetter(1, 0))
+        with self.phase("write"):
+            self.write_by_count(sorted_counts, total)
+
+    def write_by_count(self, items, total: int):
+        """
+        Writes each key with its count and occurrence rate as the items are consumed.
+
+        :param items: Iterable of (key, count) tuples already in byCount order.
+        :param total: Sum of all occurrences, used for the occurrence rate.
+        :return:
+        """
+        for k, v in items:
+            occurrence_rate = int(float(v) / total * 100)
+            self.write_output(f'{k}: {v} time(s), {occurrence_rate}%)')
 
     def parse_long(self):
         """
@@ -46,30 +897,64 @@ class SortingTool:
 
         :return:
         """
-        int_dict = defaultdict(int)
-        for line in self.lines:
-            line_list = line.split()
-            for line_int in line_list:
-                try:
-                    int_dict[int(line_int)] += 1
-                except ValueError:
-                    print(f'"{line_int}" is not a long. It will be skipped.')
+        with self.phase("parse"):
+            int_dict, skipped = self.count_tokens()
+        for line_int in skipped:
+            print(f'"{line_int}" is not a long. It will be skipped.')
         total = sum(int_dict.values())
         self.write_output(f"Total numbers: {total}.")
-        if self.sorting_type == 'natural':
-            all_sorted_ints = []
-            for k, v in sorted(int_dict.items(),
-                               key=lambda item: item[0]):
-                for _ in range(v):
-                    all_sorted_ints.append(str(k))
-            sorted_ints = ' '.join(all_sorted_ints)
-            self.write_output(f'Sorted data: {sorted_ints}')
+        if self.has_queries():
+            with self.phase("sort"):
+                self.report_queries(int_dict, total)
+        elif self.sorting_type == 'natural':
+            with self.phase("sort"):
+                sorted_ints = sorted(int_dict.items(), key=lambda item: item[0])
+            with self.phase("write"):
+                self.write_items("Sorted data: ", repeat_items((str(k), v) for k, v in sorted_ints), " ")
+        else:
+            self.report_by_count(int_dict, total)
+
+    def parse_long_numpy(self):
+        """
+        Same output as parse_long(), but parses all ints into a NumPy int64 array, sorts it (or counts it with
+        np.unique() for byCount) and formats the output in bulk.
+        Falls back to parse_long() when an int does not fit in an int64.
+
+        :return:
+        """
+        with self.phase("parse"):
+            tokens = list(itertools.chain.from_iterable(map(str.split, self.lines)))
+            parsed = parse_longs_numpy(tokens)
+            del tokens
+        if parsed is None:
+            self.parse_long()
+            return
+        int_array, skipped = parsed
+        for line_int in skipped:
+            print(f'"{line_int}" is not a long. It will be skipped.')
+        total = len(int_array)
+        self.write_output(f"Total numbers: {total}.")
+        if self.has_queries():
+            with self.phase("sort"):
+                if self.top or self.bottom:
+                    values, counts = np.unique(int_array, return_counts=True)
+                    self.write_top_bottom(dict(zip(values.tolist(), counts.tolist())), total)
+                if self.percentiles and total:
+                    ranks = [percentile_rank(percentile, total) - 1 for percentile in self.percentiles]
+                    int_array.partition(ranks)
+                    self.write_percentiles(zip(self.percentiles, int_array[ranks].tolist()))
+        elif self.sorting_type == 'natural':
+            with self.phase("sort"):
+                int_array.sort()
+            with self.phase("write"):
+                self.write_items("Sorted data: ", map(str, int_array.tolist()), " ")
         else:
-            for k, v in sorted(
-                    sorted(int_dict.items()),
-                    key=lambda item: item[1]):
-                occurrence_rate = int(float(v) / sum(int_dict.values()) * 100)
-                self.write_output(f'{k}: {v} time(s), {occurrence_rate}%)')
+            with self.phase("sort"):
+                values, counts = np.unique(int_array, return_counts=True)
+                # np.unique() returns values in order, so a stable sort by count matches parse_long().
+                order = np.argsort(counts, kind='stable')
+            with self.phase("write"):
+                self.write_by_count(zip(values[order].tolist(), counts[order].tolist()), total)
 
     def parse_line(self):
         """
@@ -80,24 +965,20 @@ class SortingTool:
 
         :return:
         """
-        line_dict = defaultdict(int)
-        for line in self.lines:
-            line_dict[line.rstrip()] += 1
+        with self.phase("parse"):
+            line_dict, _ = self.count_tokens()
         total = sum(line_dict.values())
         self.write_output(f"Total lines: {total}.")
-        if self.sorting_type == 'natural':
-            all_sorted_lines = []
-            for k, v in sorted(line_dict.items()):
-                for _ in range(v):
-                    all_sorted_lines.append(k)
-            sorted_lines = '\n'.join(all_sorted_lines)
-            self.write_output(f'Sorted data:\n{sorted_lines}')
+        if self.has_queries():
+            with self.phase("sort"):
+                self.report_queries(line_dict, total)
+        elif self.sorting_type == 'natural':
+            with self.phase("sort"):
+                sorted_lines = sorted(line_dict.items())
+            with self.phase("write"):
+                self.write_items("Sorted data:\n", repeat_items(sorted_lines), "\n")
         else:
-            for k, v in sorted(
-                    sorted(line_dict.items()),
-                    key=lambda item: item[1]):
-                occurrence_rate = int(float(v) / sum(line_dict.values()) * 100)
-                self.write_output(f'{k}: {v} time(s), {occurrence_rate}%)')
+            self.report_by_count(line_dict, total)
 
     def parse_word(self):
         """
@@ -107,27 +988,20 @@ class SortingTool:
 
         :return:
         """
-        word_dict = defaultdict(int)
-        for line in self.lines:
-            line_list = line.split()
-            for line_word in line_list:
-                word_dict[line_word] += 1
+        with self.phase("parse"):
+            word_dict, _ = self.count_tokens()
         total = sum(word_dict.values())
         self.write_output(f"Total words: {total}.")
-        if self.sorting_type == 'natural':
-            all_sorted_words = []
-            for k, v in sorted(word_dict.items(),
-                               key=lambda item: item[1]):
-                for _ in range(v):
-                    all_sorted_words.append(k)
-            sorted_words = ' '.join(all_sorted_words)
-            self.write_output(f'Sorted data: {sorted_words}')
+        if self.has_queries():
+            with self.phase("sort"):
+                self.report_queries(word_dict, total)
+        elif self.sorting_type == 'natural':
+            with self.phase("sort"):
+                sorted_words = sorted(word_dict.items(), key=lambda item: item[1])
+            with self.phase("write"):
+                self.write_items("Sorted data: ", repeat_items(sorted_words), " ")
         else:
-            for k, v in sorted(
-                    sorted(word_dict.items()),
-                    key=lambda item: item[1]):
-                occurrence_rate = int(float(v) / sum(word_dict.values()) * 100)
-                self.write_output(f'{k}: {v} time(s), {occurrence_rate}%)')
+            self.report_by_count(word_dict, total)
 
 
 
@@ -145,6 +1019,46 @@ if __name__ == "__main__":
                             default='natural')
     arg_parser.add_argument('-inputFile')
     arg_parser.add_argument('-outputFile')
+    arg_parser.add_argument('-memoryLimit',
+                            type=parse_size,
+                            help="Sort with bounded memory (e.g. 256M) by spilling sorted runs to temporary files.")
+    arg_parser.add_argument('-workers',
+                            type=positive_int,
+                            default=1,
+                            help="Number of processes used to count an input file.")
+    arg_parser.add_argument('-bufferSize',
+                            type=parse_size,
+                            default=DEFAULT_BUFFER_SIZE,
+                            help="Amount of output (e.g. 4M) collected before each write.")
+    arg_parser.add_argument('-top',
+                            type=positive_int,
+                            help="Only report the K most frequent items.")
+    arg_parser.add_argument('-bottom',
+                            type=positive_int,
+                            help="Only report the K least frequent items.")
+    arg_parser.add_argument('-percentiles',
+                            type=parse_percentiles,
+                            help="Only report these percentiles of the sorted items (e.g. 50,90,99).")
+    arg_parser.add_argument('-approximate',
+                            action='store_true',
+                            help="Report the distinct count and most frequent items (-top, 10 by default) using a "
+                                 "fixed amount of memory.")
+    arg_parser.add_argument('-errorRate',
+                            type=probability,
+                            default=DEFAULT_ERROR_RATE,
+                            help="-approximate: maximum overcount as a fraction of the total.")
+    arg_parser.add_argument('-confidence',
+                            type=probability,
+                            default=DEFAULT_CONFIDENCE,
+                            help="-approximate: probability that counts stay within -errorRate.")
+    arg_parser.add_argument('-precision',
+                            type=hll_precision,
+                            default=DEFAULT_HLL_PRECISION,
+                            help="-approximate: distinct count precision between 4 and 18.")
+    arg_parser.add_argument('-engine',
+                            choices=['python', 'numpy'],
+                            default='python',
+                            help="Engine used for -dataType long. numpy requires NumPy to be installed.")
     args, unknown = arg_parser.parse_known_args()
     if unknown:
         for item in unknown:
@@ -153,8 +1067,23 @@ if __name__ == "__main__":
         print('No data type defined!')
     if not args.sortingType:
         print('No sorting type defined!')
+    if args.engine == 'numpy' and np is None:
+        print("NumPy is not installed. The python engine will be used.")
+    if args.memoryLimit and (args.top or args.bottom or args.percentiles):
+        print("-top, -bottom and -percentiles are not available with -memoryLimit. They will be skipped.")
     if args.dataType and args.sortingType:
         SortingTool(data_type=args.dataType,
                     sorting_type=args.sortingType,
                     input_file=args.inputFile,
-                    output_file=args.outputFile)
\ No newline at end of file
+                    output_file=args.outputFile,
+                    memory_limit=args.memoryLimit,
+                    workers=args.workers,
+                    engine=args.engine,
+                    buffer_size=args.bufferSize,
+                    top=args.top,
+                    bottom=args.bottom,
+                    percentiles=args.percentiles,
+                    approximate=args.approximate,
+                    error_rate=args.errorRate,
+                    confidence=args.confidence,
+                    precision=args.precision)
\ No newline at end of file
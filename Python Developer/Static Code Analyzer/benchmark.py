@@ -0,0 +1,150 @@
+import argparse
+import ast
+import os
+import tempfile
+import time
+import tracemalloc
+
+from code_analyzer import StaticCodeAnalyzerAST, iter_lines, read_source
+
+
+def generate_module(lines: int) -> str:
+    """
+    Generates a module of roughly the given number of lines, made of small functions with parameters, mutable
+    defaults and assignments so that every AST table has entries.
+
+    :param lines: Number of lines wanted.
+    :return: Source code.
+    """
+    functions = []
+    for n in range(lines // 5):
+        functions.append(f"def function_{n}(first_{n}, Second{n}=[]):\n"
+                         f"    value_{n} = first_{n}\n"
+                         f"    Other{n} = value_{n}\n"
+                         f"    return Other{n}\n")
+    return "\n".join(functions)
+
+
+def benchmark_ast_memory(lines: int):
+    """
+    Measures the memory kept by StaticCodeAnalyzerAST for a generated module, the peak while building it, and the
+    memory allocated by looking up every line.
+
+    :param lines: Size of the generated module.
+    :return:
+    """
+    source = generate_module(lines)
+    line_count = source.count("\n") + 1
+    tree = ast.parse(source)
+    tracemalloc.start()
+    sca_ast = StaticCodeAnalyzerAST()
+    sca_ast.scan(tree)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    for line_no in range(1, line_count + 1):
+        sca_ast.get_parameters(line_no)
+        sca_ast.get_variables(line_no)
+        sca_ast.get_mutable_defaults(line_no)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # Lookups of lines with names return a new tuple each time. It is freed after use, so it is not retained, but
+    # it is still an allocation.
+    allocating = sum(table.has_values(line_no)
+                     for table in sca_ast.stats.values() for line_no in range(1, line_count + 1))
+    print(f"AST tables for {line_count:,} lines: {retained / 1024 ** 2:.1f} MiB retained, "
+          f"{peak / 1024 ** 2:.1f} MiB peak while building, "
+          f"{after - before:,} bytes retained by {line_count:,} lookups, "
+          f"{allocating:,} of {len(sca_ast.stats) * line_count:,} (table, line) pairs have names and allocate a new "
+          f"tuple on every lookup")
+
+
+def read_with_file_handle(path: str) -> str:
+    """
+    The original reading layer: read() the file for the AST, then iterate over the file again for the line checks.
+    """
+    with open(path, 'r') as infile:
+        source = infile.read()
+        infile.seek(0)
+        for line in infile:
+            line.rstrip()
+    return source
+
+
+def read_with_mapping(path: str) -> str:
+    """
+    The current reading layer: map and decode the file once and iterate over the decoded source.
+    """
+    source = read_source(path)
+    for line in iter_lines(source):
+        line.rstrip()
+    return source
+
+
+def bytes_read() -> int | None:
+    """
+    :return: Bytes this process has read through system calls so far, or None where /proc/self/io is missing.
+    """
+    try:
+        with open("/proc/self/io", 'r') as infile:
+            for line in infile:
+                if line.startswith("rchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+
+def benchmark_io(files: int, lines: int):
+    """
+    Compares both reading layers on a tree of generated files: elapsed time, bytes read and peak allocation.
+
+    :param files: Number of files in the tree.
+    :param lines: Size of each file.
+    :return:
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        source = generate_module(lines)
+        paths = []
+        for n in range(files):
+            paths.append(os.path.join(directory, f"module_{n}.py"))
+            with open(paths[-1], 'w') as outfile:
+                outfile.write(source)
+        size = os.path.getsize(paths[0]) * files
+        for name, read in (("file handle", read_with_file_handle), ("mmap", read_with_mapping)):
+            start_bytes = bytes_read()
+            start = time.perf_counter()
+            for path in paths:
+                read(path)
+            seconds = time.perf_counter() - start
+            end_bytes = bytes_read()
+            tracemalloc.start()
+            peak = 0
+            for path in paths:
+                tracemalloc.reset_peak()
+                read(path)
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            read_text = ""
+            if start_bytes is not None:
+                read_text = f"{(end_bytes - start_bytes) / size:.2f}x file size copied by read()"
+            print(f"{name:>11}: {files} files of {size / files / 1024 ** 2:.1f} MiB in {seconds:.3f}s, "
+                  f"{peak / 1024 ** 2:.1f} MiB peak allocation per file, {read_text}")
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Benchmark the Static Code Analyzer.")
+    arg_parser.add_argument("--lines",
+                            type=int,
+                            default=500_000,
+                            help="Number of lines in the generated module.")
+    arg_parser.add_argument("--files",
+                            type=int,
+                            default=20,
+                            help="Number of files in the tree used to benchmark reading.")
+    arg_parser.add_argument("--file-lines",
+                            type=int,
+                            default=100_000,
+                            help="Number of lines in each of those files.")
+    args = arg_parser.parse_args()
+    benchmark_ast_memory(args.lines)
+    benchmark_io(args.files, args.file_lines)
@@ -1,21 +1,147 @@
+import argparse
 import ast
+import hashlib
+import io
+import json
+import locale
+import mmap
+import multiprocessing
 import os
 import re
+import socket
+import socketserver
+import stat
 import sys
+import tempfile
+import threading
+import time
+import tokenize
+import urllib.parse
 
-from collections import defaultdict
+from array import array
+from contextlib import contextmanager, nullcontext
+from functools import partial
+
+
+# Patterns are compiled once and shared by every file and line.
+CLASS_NAME_PATTERN = re.compile(r"\S+_\S+|[a-z_]+")
+UPPERCASE_PATTERN = re.compile(r"[A-Z]")
+TODO_PATTERN = re.compile(r"TODO", re.IGNORECASE)
+# Part of every cache key. Bump it whenever a check changes so that stale cached findings are not reused.
+RULESET_VERSION = "2"
+# Errors that make one file impossible to analyze. They are reported for that file and the other files are still
+# analyzed.
+ANALYSIS_ERRORS = (OSError, SyntaxError, tokenize.TokenError, UnicodeDecodeError)
+# Names of the files a ResultCache creates in its two character subdirectories: entries, and the temporary files
+# they are written to first. Eviction never touches anything else in the cache directory.
+CACHE_SUBDIRECTORY_PATTERN = re.compile(r"[0-9a-f]{2}")
+CACHE_ENTRY_PATTERN = re.compile(r"[0-9a-f]{64}\.json")
+CACHE_TEMP_PATTERN = re.compile(r"tmp\w+\.tmp")
+# Seconds after which a temporary cache file is considered left over from a crashed run.
+CACHE_TEMP_MAX_AGE = 60 * 60
+# Short description of every rule, used in SARIF output.
+RULES = {
+    "S001": "Line too long",
+    "S002": "Indentation is not a multiple of four",
+    "S003": "Unnecessary semicolon",
+    "S004": "At least two spaces required before inline comments",
+    "S005": "TODO found",
+    "S006": "More than two blank lines used before this line",
+    "S007": "Too many spaces after 'class' or 'def'",
+    "S008": "Class name should use CamelCase",
+    "S009": "Function name should use snake_case",
+    "S010": "Argument name should use snake_case",
+    "S011": "Variable in function should be snake_case",
+    "S012": "Default argument value is mutable",
+}
+# Rule code and StaticCodeAnalyzer method of every line check, in the order they run on each line.
+CHECKS = [
+    ("S001", "check_line_length"),
+    ("S002", "check_indentation"),
+    ("S003", "check_semicolon"),
+    ("S004", "check_comment_spaces"),
+    ("S005", "check_todo"),
+    ("S006", "check_empty_line_count"),
+    ("S007", "check_def_spacing"),
+    ("S008", "check_class_def_case"),
+    ("S009", "check_function_def_case"),
+    ("S010", "check_arg_case"),
+    ("S011", "check_variable_case"),
+    ("S012", "check_mutable_default_arg"),
+]
+# Rules that need the AST or the token index. Neither is built for a file unless one of its rules is selected.
+AST_RULES = {"S010", "S011", "S012"}
+TOKEN_RULES = {"S003", "S004", "S005", "S007", "S008", "S009"}
+# Number of characters of source split into lines at a time.
+LINE_BLOCK_SIZE = 64 * 1024
+# Number of characters of output collected before writing to stdout.
+OUTPUT_BUFFER_SIZE = 64 * 1024
+
+
+class LineIndex:
+    """
+    Compact read-only mapping of line numbers to the values found on them. The values of every line are stored in
+    one flat tuple ordered by line, and offsets[line_no]:offsets[line_no + 1] is the slice holding a line's values.
+    Lines without values share the empty tuple, so looking them up never allocates. Looking up a line with values
+    allocates a new tuple of just those values, which is not kept by the index.
+    """
+    __slots__ = ("offsets", "values")
+
+    def __init__(self, line_numbers: array, values: list):
+        """
+        :param line_numbers: Line number of each value, in any order.
+        :param values: Values in the same order as line_numbers. Values on the same line keep this order.
+        """
+        order = sorted(range(len(values)), key=line_numbers.__getitem__)
+        last_line = line_numbers[order[-1]] if order else 0
+        self.offsets = array('I', bytes(4 * (last_line + 2)))
+        for line_no in line_numbers:
+            self.offsets[line_no + 1] += 1
+        for line_no in range(1, last_line + 2):
+            self.offsets[line_no] += self.offsets[line_no - 1]
+        self.values = tuple(values[index] for index in order)
+
+    def has_values(self, line_no: int) -> bool:
+        return line_no + 1 < len(self.offsets) and self.offsets[line_no] != self.offsets[line_no + 1]
+
+    def get(self, line_no: int) -> tuple:
+        if line_no + 1 >= len(self.offsets):
+            return ()
+        return self.values[self.offsets[line_no]:self.offsets[line_no + 1]]
 
 
 class StaticCodeAnalyzerAST(ast.NodeVisitor):
     """
     AST Implementation to scan for parameters, variables, and default values.
+    Call scan() rather than visit() so that the collected names are packed into LineIndex tables.
     """
     def __init__(self):
-        self.stats = {
-            "variables": defaultdict(list),
-            "parameters": defaultdict(list),
-            "is_constant_default": defaultdict(list),
+        # (line numbers, values) collected while visiting, packed by build_index().
+        self.collected = {
+            "variables": (array('I'), []),
+            "parameters": (array('I'), []),
+            "is_constant_default": (array('I'), []),
         }
+        self.stats = {}
+
+    def scan(self, tree: ast.AST):
+        """
+        Visits the whole tree once, then builds the per-line lookup tables.
+
+        :param tree: Parsed module.
+        :return:
+        """
+        self.visit(tree)
+        self.build_index()
+
+    def build_index(self):
+        self.stats = {name: LineIndex(*collected) for name, collected in self.collected.items()}
+        self.collected = {}
+
+    def collect(self, name: str, line_no: int, value):
+        line_numbers, values = self.collected[name]
+        line_numbers.append(line_no)
+        values.append(value)
 
     def visit_Name(self, node):
         """
@@ -25,7 +151,7 @@ class StaticCodeAnalyzerAST(ast.NodeVisitor):
         :return:
         """
         if isinstance(node.ctx, ast.Store):
-            self.stats["variables"][node.lineno].append(node.id)
+            self.collect("variables", node.lineno, node.id)
         self.generic_visit(node)
 
     def visit_FunctionDef(self, node):
@@ -37,28 +163,28 @@ class StaticCodeAnalyzerAST(ast.NodeVisitor):
         :return:
         """
         for arg in node.args.args:
-            self.stats["parameters"][arg.lineno].append(arg.arg)
+            self.collect("parameters", arg.lineno, arg.arg)
         for default in node.args.defaults:
-            self.stats["is_constant_default"][node.lineno].append(isinstance(default, ast.Constant))
+            self.collect("is_constant_default", node.lineno, isinstance(default, ast.Constant))
         self.generic_visit(node)
 
-    def get_parameters(self, line_no: int) -> list:
+    def get_parameters(self, line_no: int) -> tuple:
         """
-        Returns a list of parameters for a given line number.
+        Returns the parameters for a given line number.
 
         :param line_no: Line number that is being analyzed as an index to the list.
-        :return: List of parameters at the given line number.
+        :return: Tuple of parameters at the given line number.
         """
-        return self.stats["parameters"][line_no]
+        return self.stats["parameters"].get(line_no)
 
-    def get_variables(self, line_no: int) -> list:
+    def get_variables(self, line_no: int) -> tuple:
         """
-        Returns a list of variables for a given line number.
+        Returns the variables for a given line number.
 
         :param line_no: Line number that is being analyzed as an index to the list.
-        :return: List of variables at the given line number.
+        :return: Tuple of variables at the given line number.
         """
-        return self.stats["variables"][line_no]
+        return self.stats["variables"].get(line_no)
 
     def get_mutable_defaults(self, line_no: int) -> str|None:
         """
@@ -66,133 +192,886 @@ class StaticCodeAnalyzerAST(ast.NodeVisitor):
         :param line_no: Line number that is being analyzed as an index to the list.
         :return: str containing a mutable default value.
         """
-        for parameter, is_default in zip(self.get_parameters(line_no), self.stats["is_constant_default"][line_no]):
+        for parameter, is_default in zip(self.get_parameters(line_no), self.stats["is_constant_default"].get(line_no)):
             if is_default:
                 pass
             else:
                 return parameter
 
+
+class StaticCodeAnalyzerTokens:
+    """
+    Tokenizes a source file once and indexes, by line number, everything the token based checks need: comments,
+    semicolons and the names following class/def. Strings and comments are single tokens, so their contents can no
+    longer trigger S003, S004, S005 or S007-S009.
+    """
+    def __init__(self, source: str):
+        # Column of the first comment and its text.
+        self.comments = {}
+        # Lines with a semicolon followed by white space or the end of the line.
+        self.semicolons = set()
+        # (keyword, name, spaces between them) for the first class/def on a line.
+        self.definitions = {}
+        previous = None
+        for token in tokenize.generate_tokens(partial(next, iter_lines(source), "")):
+            line_no, column = token.start
+            if token.type == tokenize.COMMENT:
+                self.comments.setdefault(line_no, (column, token.string))
+            elif token.type == tokenize.OP and token.string == ';':
+                if not token.line[token.end[1]:token.end[1] + 1].strip():
+                    self.semicolons.add(line_no)
+            elif (token.type == tokenize.NAME and previous is not None and previous.type == tokenize.NAME
+                  and previous.string in ("class", "def") and previous.end[0] == line_no):
+                self.definitions.setdefault(line_no, (previous.string, token.string, column - previous.end[1]))
+            if token.type not in (tokenize.NL, tokenize.NEWLINE, tokenize.COMMENT):
+                previous = token
+
+    def get_comment(self, line_no: int) -> tuple | None:
+        """
+        :param line_no: Line number that is being analyzed.
+        :return: (column, text) of the comment on the line, if any.
+        """
+        return self.comments.get(line_no)
+
+    def has_semicolon(self, line_no: int) -> bool:
+        return line_no in self.semicolons
+
+    def get_definition(self, line_no: int) -> tuple | None:
+        """
+        :param line_no: Line number that is being analyzed.
+        :return: (keyword, name, spaces) for a class or function defined on the line, if any.
+        """
+        return self.definitions.get(line_no)
+
+
+class Profiler:
+    """
+    Cumulative seconds and call counts per step of the analysis: reading files, ast.parse, the AST visit,
+    tokenizing and every rule. Workers send their stats back with their findings and the main process merges them,
+    so one Profiler covers a whole directory run. Seconds are summed over all workers.
+    """
+    def __init__(self):
+        # step -> [seconds, calls]
+        self.stats = {}
+
+    def add(self, step: str, seconds: float, calls: int = 1):
+        entry = self.stats.setdefault(step, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += calls
+
+    @contextmanager
+    def measure(self, step: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(step, time.perf_counter() - start)
+
+    def merge(self, stats: dict):
+        for step, (seconds, calls) in stats.items():
+            self.add(step, seconds, calls)
+
+    def sorted_stats(self) -> list:
+        """
+        :return: List of (step, seconds, calls), slowest step first.
+        """
+        return sorted(((step, seconds, calls) for step, (seconds, calls) in self.stats.items()),
+                      key=lambda stat: stat[1], reverse=True)
+
+    def format_table(self) -> str:
+        total = sum(seconds for seconds, _ in self.stats.values())
+        lines = [f"{'Step':<32} {'Seconds':>10} {'%':>6} {'Calls':>12} {'us/call':>10}"]
+        for step, seconds, calls in self.sorted_stats():
+            share = seconds / total if total else 0
+            lines.append(f"{step:<32} {seconds:>10.4f} {share:>6.1%} {calls:>12,} {seconds / calls * 1e6:>10.2f}")
+        lines.append(f"{'Total':<32} {total:>10.4f}")
+        return "\n".join(lines)
+
+    def format_json(self) -> str:
+        return json.dumps([{"step": step, "seconds": seconds, "calls": calls}
+                           for step, seconds, calls in self.sorted_stats()], indent=2)
+
+
 class StaticCodeAnalyzer:
     """
     Static Code Analyzer to scan for lines that do not align to PEP8.
     """
-    def __init__(self, path: str):
+    def __init__(self, path: str, source: str = None, profiler: "Profiler" = None, checks: list = CHECKS):
+        """
+        :param path: File to analyze.
+        :param source: Contents of the file when the caller already read it.
+        :param profiler: Optional Profiler that receives the time spent in each step and rule.
+        :param checks: (code, method name) pairs of the rules to run, from select_checks().
+        """
         self.i = 0
         self.line = ''
         self.empty_line_count = 0
         self.path = path
-        with open(self.path, 'r') as infile:
-            # Instantiate our AST implementation and load our input file.
+        # (line number, code, message) for every violation, in line order.
+        self.findings = []
+        measure = profiler.measure if profiler else nullcontext
+        if source is None:
+            with measure("read"):
+                source = read_source(self.path)
+        codes = {code for code, _ in checks}
+        # Instantiate our AST implementation and load our input file.
+        self.sca_ast = None
+        if codes & AST_RULES:
             self.sca_ast = StaticCodeAnalyzerAST()
-            self.sca_ast.visit(ast.parse(infile.read()))
-            # Reset the file back to the start to iterate through.
-            infile.seek(0)
-            for self.i, self.line in enumerate(infile):
-                # increment self.i for printing purposes
-                self.i += 1
-                # strip out any ending white space
-                self.line = self.line.rstrip()
-                if self.line:
-                    # For non-empty lines, perform validations based on PEP8
-                    self.check_line_length()
-                    self.check_indentation()
-                    self.check_semicolon()
-                    self.check_comment_spaces()
-                    self.check_todo()
-                    self.check_empty_line_count()
-                    self.check_def_spacing()
-                    self.check_class_def_case()
-                    self.check_function_def_case()
-                    self.check_arg_case()
-                    self.check_variable_case()
-                    self.check_mutable_default_arg()
+            with measure("ast.parse"):
+                tree = ast.parse(source)
+            with measure("ast visit"):
+                self.sca_ast.scan(tree)
+        # Tokenize once. The token based checks only look up their line in the index.
+        self.sca_tokens = None
+        if codes & TOKEN_RULES:
+            with measure("tokenize"):
+                self.sca_tokens = StaticCodeAnalyzerTokens(source)
+        checks = [(f"{code} {name}", getattr(self, name)) for code, name in checks]
+        # Iterate through the same source instead of re-reading the file.
+        for self.i, self.line in enumerate(iter_lines(source), start=1):
+            # strip out any ending white space
+            self.line = self.line.rstrip()
+            if self.line:
+                # For non-empty lines, perform validations based on PEP8
+                if profiler:
+                    for step, check in checks:
+                        start = time.perf_counter()
+                        check()
+                        profiler.add(step, time.perf_counter() - start)
                 else:
-                    # Increment the empty line counter
-                    # Will violate during check_empty_line_count() if the count is above 2.
-                    self.empty_line_count += 1
+                    for _, check in checks:
+                        check()
+            else:
+                # Increment the empty line counter
+                # Will violate during check_empty_line_count() if the count is above 2.
+                self.empty_line_count += 1
+
+    def report(self, code: str, message: str):
+        """
+        Records a violation on the line being analyzed.
+
+        :param code: Rule code such as S001.
+        :param message: Description of the violation.
+        :return:
+        """
+        self.findings.append((self.i, code, message))
+
+    def format_findings(self) -> list:
+        return format_findings(self.path, self.findings)
 
     def check_line_length(self):
         # Line length must be below 80 characters.
         if len(self.line) >= 80:
-            print(f"{self.path}: Line {self.i}: S001 Too long")
+            self.report("S001", "Too long")
 
     def check_indentation(self):
         # If the length of our input line minus the input line after lstrip() is a multiple of 4, we're good.
         if (len(self.line) - len(self.line.lstrip())) % 4 == 0:
             pass
         else:
-            print(f"{self.path}: Line {self.i}: S002 Indentation is not a multiple of four")
+            self.report("S002", "Indentation is not a multiple of four")
 
     def check_semicolon(self):
         # Semicolons are only valid as part of a comment or in a string.
-        if match := re.search(r'^([^#])*;(?!\S)', self.line):
-            print(f"{self.path}: Line {self.i}: S003 Unnecessary semicolon")
+        # Those are separate tokens, so only semicolon operators are indexed.
+        if self.sca_tokens.has_semicolon(self.i):
+            self.report("S003", "Unnecessary semicolon")
 
     def check_comment_spaces(self):
-        # Strip out anything after the first comment character
-        line_split = self.line.split('#')
-        uncommented_line = line_split[0]
-        # Check for the gap between the last character and what would have been the comment character
-        if (len(line_split) > 1 and
-                uncommented_line and
+        # Keep only the code before the comment token
+        comment = self.sca_tokens.get_comment(self.i)
+        uncommented_line = self.line[:comment[0]] if comment else ''
+        # Check for the gap between the last character and the comment character
+        if (uncommented_line and
                 (len(uncommented_line) - len(uncommented_line.rstrip())) < 2):
-            print(f"{self.path}: Line {self.i}: S004 At least two spaces required before inline comments")
+            self.report("S004", "At least two spaces required before inline comments")
 
     def check_todo(self):
         # Scan for any comment containing "TODO" with any case.
-        if re.search(r"#.*TODO", self.line, re.IGNORECASE):
-            print(f"{self.path}: Line {self.i}: S005 TODO found")
+        comment = self.sca_tokens.get_comment(self.i)
+        if comment and TODO_PATTERN.search(comment[1]):
+            self.report("S005", "TODO found")
 
     def check_empty_line_count(self):
         # More than two consecutive blank lines is illegal.
         if self.empty_line_count > 2:
-            print(f"{self.path}: Line {self.i}: S006 More than two blank lines used before this line")
+            self.report("S006", "More than two blank lines used before this line")
         self.empty_line_count = 0
 
     def check_def_spacing(self):
         # Class and function definitions must have only one space between the class/def and name.
-        # We use lstrip() to remove any leading whitespace to make our lives easier.
-        if match := re.search(r"(class|def)\s{2,}\S+", self.line.lstrip()):
-            print(f"{self.path}: Line {self.i}: S007 Too many spaces after '{match.group(1)}'")
+        definition = self.sca_tokens.get_definition(self.i)
+        if definition and definition[2] > 1:
+            self.report("S007", f"Too many spaces after '{definition[0]}'")
 
     def check_class_def_case(self):
         # Classes must use CamelCase.
-        # We use lstrip() to remove any leading whitespace to make our lives easier.
-        if match := re.search(r"(class\s)((\S+_\S+)|([a-z_]+)):", self.line.lstrip()):
-            print(f"{self.path}: Line {self.i}: S008 Class name '{match.group(2)}' should use CamelCase")
+        definition = self.sca_tokens.get_definition(self.i)
+        if definition and definition[0] == "class" and CLASS_NAME_PATTERN.fullmatch(definition[1]):
+            self.report("S008", f"Class name '{definition[1]}' should use CamelCase")
 
     def check_function_def_case(self):
         # Functions must use snake_case.
-        # We use lstrip() to remove any leading whitespace to make our lives easier.
-        if match := re.search(r"def\s(\S*[A-Z]\S*)\(", self.line.lstrip()):
-            print(f"{self.path}: Line {self.i}: S009 Function name '{match.group(1)}' should use snake_case")
+        definition = self.sca_tokens.get_definition(self.i)
+        if definition and definition[0] == "def" and UPPERCASE_PATTERN.search(definition[1]):
+            self.report("S009", f"Function name '{definition[1]}' should use snake_case")
 
     def check_arg_case(self):
         # Iterates through our AST data for parameters for the given line.
         # Parameters must use snake_case.
         for parameter in self.sca_ast.get_parameters(self.i):
-            if re.search(r"\S*[A-Z]\S*", parameter):
-                print(f"{self.path}: Line {self.i}: S010 Argument name '{parameter}' should use snake_case")
+            if UPPERCASE_PATTERN.search(parameter):
+                self.report("S010", f"Argument name '{parameter}' should use snake_case")
                 break
 
     def check_variable_case(self):
         # Iterates through our AST data for variables for the given line.
         # Parameters must use snake_case.
         for variable in self.sca_ast.get_variables(self.i):
-            if re.search(r"\S*[A-Z]\S*", variable):
-                print(f"{self.path}: Line {self.i}: S011 Variable '{variable}' in function should be snake_case")
+            if UPPERCASE_PATTERN.search(variable):
+                self.report("S011", f"Variable '{variable}' in function should be snake_case")
                 break
 
     def check_mutable_default_arg(self):
         # Call the function to get mutable defaults.
         # If anything is returned, there needs to be an error.
         if self.sca_ast.get_mutable_defaults(self.i):
-            print(f"{self.path}: Line {self.i}: S012 Default argument value is mutable")
+            self.report("S012", "Default argument value is mutable")
+
+
+def select_checks(select: set = None, ignore: set = None) -> list:
+    """
+    Builds the check pipeline for a run.
+
+    :param select: Rule codes to run. All rules when empty.
+    :param ignore: Rule codes to skip, applied after select.
+    :return: (code, method name) pairs from CHECKS, in their usual order.
+    """
+    return [(code, name) for code, name in CHECKS
+            if (not select or code in select) and not (ignore and code in ignore)]
+
+
+def format_findings(path: str, findings: list) -> list:
+    return [f"{path}: Line {line_no}: {code} {message}" for line_no, code, message in findings]
+
+
+def decode_source(data) -> str:
+    """
+    Decodes file contents the same way open(path, 'r').read() does: default encoding and universal newlines.
+
+    :param data: Raw file contents, as bytes or any other buffer such as an mmap.
+    :return: Source code.
+    """
+    source = str(data, locale.getpreferredencoding(False))
+    if "\r" in source:
+        source = source.replace("\r\n", "\n").replace("\r", "\n")
+    return source
+
+
+@contextmanager
+def map_file(path: str):
+    """
+    Maps a file into memory read-only, so that hashing and decoding it work on the page cache directly instead of
+    a copy made by read().
+
+    :param path: File to map.
+    :return: Context manager giving the mmap, or empty bytes for an empty file, which cannot be mapped.
+    """
+    with open(path, 'rb') as infile:
+        if not os.fstat(infile.fileno()).st_size:
+            yield b""
+            return
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+
+def read_source(path: str, mapped: bool = True) -> str:
+    """
+    :param path: File to read.
+    :param mapped: Whether to map the file instead of reading it. A mapped file that another process truncates
+    kills this process with SIGBUS when the missing pages are read, so long-running processes read files instead.
+    :return: Decoded source.
+    """
+    if not mapped:
+        with open(path, 'rb') as infile:
+            return decode_source(infile.read())
+    with map_file(path) as data:
+        return decode_source(data)
+
+
+def iter_lines(source: str):
+    """
+    Yields the lines of source with their line endings, like iterating over a file. Only one block of about
+    LINE_BLOCK_SIZE characters is copied into an io.StringIO at a time, instead of the whole source.
+
+    :param source: Decoded source code.
+    :return: Iterator over lines.
+    """
+    start = 0
+    while start < len(source):
+        end = source.find("\n", start + LINE_BLOCK_SIZE) + 1 or len(source)
+        yield from io.StringIO(source[start:end])
+        start = end
+
+
+class ResultCache:
+    """
+    On-disk cache of findings keyed by a hash of the file contents, RULESET_VERSION and the selected rules. Entries do
+    not depend on the file path, so identical files share one entry.
+    """
+    def __init__(self, directory: str, checks: list = CHECKS):
+        self.directory = directory
+        self.prefix = f"{RULESET_VERSION}\0{','.join(code for code, _ in checks)}\0".encode()
+
+    def key(self, data: bytes) -> str:
+        # Hash in two steps: concatenating would copy a memory mapped file into a new bytes object.
+        digest = hashlib.sha256(self.prefix)
+        digest.update(data)
+        return digest.hexdigest()
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> list | None:
+        """
+        :param key: Cache key from key().
+        :return: List of (line number, code, message) findings, or None on a miss.
+        """
+        entry_path = self.entry_path(key)
+        try:
+            with open(entry_path, 'r') as entry:
+                findings = [tuple(finding) for finding in json.load(entry)]
+        except (OSError, ValueError):
+            return None
+        # Refresh the modification time so that eviction removes the least recently used entries first.
+        try:
+            os.utime(entry_path)
+        except FileNotFoundError:
+            # Evicted by a concurrent run in the meantime.
+            pass
+        return findings
+
+    def put(self, key: str, findings: list):
+        entry_path = self.entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        # Write to a temporary file first so that concurrent workers never read a partial entry.
+        descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(entry_path), prefix="tmp", suffix=".tmp")
+        with os.fdopen(descriptor, 'w') as entry:
+            json.dump(findings, entry)
+        os.replace(temp_path, entry_path)
+
+    def iter_files(self):
+        """
+        Yields the files this cache created: entries and temporary files in its two character subdirectories. Any
+        other file or directory, such as user data in a shared directory, is left alone.
+
+        :return: Iterator over (path, is an entry) pairs.
+        """
+        try:
+            subdirectories = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for subdirectory in subdirectories:
+            subdirectory_path = os.path.join(self.directory, subdirectory)
+            if not CACHE_SUBDIRECTORY_PATTERN.fullmatch(subdirectory) or not os.path.isdir(subdirectory_path):
+                continue
+            try:
+                filenames = os.listdir(subdirectory_path)
+            except FileNotFoundError:
+                continue
+            for filename in filenames:
+                if CACHE_ENTRY_PATTERN.fullmatch(filename) and filename.startswith(subdirectory):
+                    yield os.path.join(subdirectory_path, filename), True
+                elif CACHE_TEMP_PATTERN.fullmatch(filename):
+                    yield os.path.join(subdirectory_path, filename), False
+
+    @staticmethod
+    def remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Runs sharing the cache may evict the same file at the same time.
+            pass
+
+    def evict(self, max_size: int, max_age: float):
+        """
+        Removes entries older than max_age seconds, then the least recently used entries until the cache is no larger
+        than max_size bytes. Temporary files left by crashed runs are removed after CACHE_TEMP_MAX_AGE seconds.
+
+        :param max_size: Maximum total size in bytes.
+        :param max_age: Maximum age in seconds since an entry was last used.
+        :return:
+        """
+        entries = []
+        now = time.time()
+        for path, is_entry in self.iter_files():
+            try:
+                file_stat = os.stat(path)
+            except OSError:
+                continue
+            if now - file_stat.st_mtime > (max_age if is_entry else CACHE_TEMP_MAX_AGE):
+                self.remove(path)
+            elif is_entry:
+                entries.append((file_stat.st_mtime, file_stat.st_size, path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total_size <= max_size:
+                break
+            self.remove(entry_path)
+            total_size -= size
+
+
+def find_python_files(path: str) -> list:
+    """
+    Returns path itself if it is a file, otherwise every .py file below it, recursively, in sorted order.
+
+    :param path: File or directory to analyze.
+    :return: List of file paths.
+    """
+    if os.path.isfile(path):
+        return [path]
+    files = []
+    for root, _, filenames in os.walk(path):
+        files.extend(os.path.join(root, filename) for filename in filenames if filename.endswith(".py"))
+    return sorted(files)
+
+
+def analyze_file(path: str, cache: ResultCache = None, profile: bool = False, checks: list = CHECKS) -> tuple:
+    """
+    Worker entry point: analyzes one file, or loads its findings from the cache.
+
+    :param path: File to analyze.
+    :param cache: Optional ResultCache.
+    :param profile: Whether to time every step of the analysis.
+    :param checks: Rules to run, from select_checks().
+    :return: Tuple of the path, its (line number, code, message) findings, whether they came from the cache, the
+    Profiler stats of this file (empty unless profile is set) and the error that stopped the analysis, or None.
+    """
+    profiler = Profiler() if profile else None
+    measure = profiler.measure if profiler else nullcontext
+    try:
+        if cache is None:
+            analyzer = StaticCodeAnalyzer(path, profiler=profiler, checks=checks)
+            return path, analyzer.findings, False, profiler.stats if profiler else {}, None
+        # The file is mapped once: the cache key is hashed from the mapping and it is only decoded on a cache miss.
+        with map_file(path) as data:
+            # Hashing reads every page of the mapping, so it is counted as reading the file.
+            with measure("read"):
+                key = cache.key(data)
+            with measure("cache read"):
+                findings = cache.get(key)
+            if findings is not None:
+                return path, findings, True, profiler.stats if profiler else {}, None
+            source = decode_source(data)
+        analyzer = StaticCodeAnalyzer(path, source, profiler, checks)
+    except ANALYSIS_ERRORS as err:
+        return path, [], False, profiler.stats if profiler else {}, f"{type(err).__name__}: {err}"
+    with measure("cache write"):
+        cache.put(key, analyzer.findings)
+    return path, analyzer.findings, False, profiler.stats if profiler else {}, None
+
+
+def analyze_files(paths: list, jobs: int = 1, cache: ResultCache = None, profile: bool = False,
+                  checks: list = CHECKS):
+    """
+    Analyzes every file, in a process pool when jobs is above 1. Results are yielded in the order of paths, so the
+    output is the same for any number of jobs.
+
+    :param paths: Files to analyze.
+    :param jobs: Number of worker processes.
+    :param cache: Optional ResultCache shared by the workers.
+    :param profile: Whether the workers time every step of the analysis.
+    :param checks: Rules to run, from select_checks().
+    :return: Iterator over (path, findings, cache hit, profiler stats, error) tuples for each file.
+    """
+    worker = partial(analyze_file, cache=cache, profile=profile, checks=checks)
+    if jobs <= 1 or len(paths) <= 1:
+        yield from map(worker, paths)
+        return
+    with multiprocessing.Pool(jobs) as pool:
+        # Small chunks keep the workers balanced when file sizes vary a lot.
+        yield from pool.imap(worker, paths, chunksize=max(1, min(16, len(paths) // (jobs * 4))))
+
+
+class FindingsWriter:
+    """
+    Writes findings as plain text, one per line, like the original print() output. Output is collected and written
+    to the stream in blocks of about OUTPUT_BUFFER_SIZE characters instead of once per finding.
+    Subclasses override format_file(), start() and finish() for other formats.
+    """
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.parts = []
+        self.size = 0
+
+    def write(self, text: str):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= OUTPUT_BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.parts:
+            self.stream.write(''.join(self.parts))
+            self.parts = []
+            self.size = 0
+        self.stream.flush()
+
+    def start(self):
+        pass
+
+    def write_file(self, path: str, findings: list):
+        if findings:
+            self.write(self.format_file(path, findings))
+
+    def format_file(self, path: str, findings: list) -> str:
+        return ''.join(f"{finding}\n" for finding in format_findings(path, findings))
+
+    def finish(self):
+        self.flush()
+
+
+class JsonLinesWriter(FindingsWriter):
+    """
+    One JSON object per finding: {"path": ..., "line": ..., "code": ..., "message": ...}.
+    """
+    def format_file(self, path: str, findings: list) -> str:
+        return ''.join(json.dumps({"path": path, "line": line_no, "code": code, "message": message}) + "\n"
+                       for line_no, code, message in findings)
+
+
+class SarifWriter(FindingsWriter):
+    """
+    A single SARIF 2.1.0 log. Results are streamed between the opening and closing parts of the document, so the
+    whole log is never held in memory.
+    """
+    def __init__(self, stream=None):
+        super().__init__(stream)
+        self.first_result = True
+
+    def start(self):
+        driver = {"name": "StaticCodeAnalyzer",
+                  "version": RULESET_VERSION,
+                  "rules": [{"id": code, "shortDescription": {"text": text}} for code, text in RULES.items()]}
+        header = json.dumps({"version": "2.1.0",
+                             "$schema": "https://json.schemastore.org/sarif-2.1.0.json",
+                             "runs": [{"tool": {"driver": driver}, "results": []}]})
+        # Everything up to the empty results array, which is filled in by format_file().
+        self.write(header[:header.rindex("[]")] + "[")
+
+    def format_file(self, path: str, findings: list) -> str:
+        results = []
+        # A relative URI reference: separators become "/" and characters such as spaces are percent-encoded.
+        uri = urllib.parse.quote(path.replace(os.sep, "/"))
+        for line_no, code, message in findings:
+            result = json.dumps({"ruleId": code,
+                                 "level": "warning",
+                                 "message": {"text": message},
+                                 "locations": [{"physicalLocation": {
+                                     "artifactLocation": {"uri": uri},
+                                     "region": {"startLine": line_no}}}]})
+            results.append(result if self.first_result else f",{result}")
+            self.first_result = False
+        return ''.join(results)
+
+    def finish(self):
+        self.write("]}]}\n")
+        self.flush()
+
+
+FINDINGS_WRITERS = {"text": FindingsWriter, "jsonl": JsonLinesWriter, "sarif": SarifWriter}
+
+
+class AnalyzerWatcher:
+    """
+    Keeps the formatted findings of every .py file below root in memory. Files are re-analyzed only when their
+    modification time or size changes, either by the polling thread started with watch() or when a client asks for
+    them.
+    """
+    def __init__(self, root: str, checks: list = CHECKS):
+        self.root = os.path.abspath(root)
+        self.checks = checks
+        self.lock = threading.Lock()
+        # path -> ((mtime_ns, size), formatted findings)
+        self.results = {}
+
+    def refresh_file(self, path: str):
+        try:
+            file_stat = os.stat(path)
+        except OSError:
+            with self.lock:
+                self.results.pop(path, None)
+            return
+        signature = (file_stat.st_mtime_ns, file_stat.st_size)
+        with self.lock:
+            cached = self.results.get(path)
+        if cached and cached[0] == signature:
+            return
+        try:
+            # Editors rewrite files in place, so the server never maps them, see read_source().
+            findings = StaticCodeAnalyzer(path, read_source(path, mapped=False), checks=self.checks).format_findings()
+        except OSError:
+            # Deleted or renamed since os.stat(), as editors do when saving. The next refresh sees the new file.
+            with self.lock:
+                self.results.pop(path, None)
+            return
+        except (SyntaxError, tokenize.TokenError, UnicodeDecodeError) as err:
+            # Keep serving the rest of the tree while a file is being edited.
+            findings = [f"{path}: {type(err).__name__}: {err}"]
+        with self.lock:
+            self.results[path] = (signature, findings)
+
+    def refresh(self, path: str = None):
+        """
+        Re-analyzes changed files below path (self.root by default) and forgets deleted ones.
+
+        :param path: File or directory to refresh.
+        :return:
+        """
+        path = path or self.root
+        paths = find_python_files(path) if os.path.exists(path) else []
+        existing = set(paths)
+        prefix = os.path.join(path, "")
+        with self.lock:
+            known_paths = list(self.results)
+        # Requests wait for the lock, so only the deletions are made while holding it.
+        removed = [known for known in known_paths
+                   if (known == path or known.startswith(prefix)) and known not in existing]
+        if removed:
+            with self.lock:
+                for known in removed:
+                    self.results.pop(known, None)
+        for file_path in paths:
+            self.refresh_file(file_path)
+
+    def contains(self, path: str) -> bool:
+        """
+        :param path: Absolute file or directory path.
+        :return: Whether path is root or below it.
+        """
+        return path == self.root or path.startswith(os.path.join(self.root, ""))
+
+    def get_findings(self, path: str) -> list:
+        """
+        :param path: Absolute file or directory path below root.
+        :return: Formatted findings of every file below path, in path and line order.
+        """
+        if not self.contains(path):
+            raise ValueError(f"{path} is not below {self.root}")
+        self.refresh(path)
+        prefix = os.path.join(path, "")
+        with self.lock:
+            return [finding
+                    for known in sorted(self.results) if known == path or known.startswith(prefix)
+                    for finding in self.results[known][1]]
+
+    def watch(self, interval: float, stop: threading.Event):
+        while not stop.wait(interval):
+            try:
+                self.refresh()
+            except Exception as err:
+                # Polling has to outlive any one bad refresh, or the results would silently go stale.
+                print(f"Refresh failed: {type(err).__name__}: {err}", file=sys.stderr)
+
+
+class AnalyzerRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Reads one JSON request such as {"path": "/abs/path/file.py"} and answers with the findings, one per line.
+    """
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            # A connection without a request, such as the check in remove_socket().
+            return
+        try:
+            request = json.loads(line)
+            path = os.path.abspath(request["path"])
+        except (ValueError, KeyError, TypeError):
+            self.wfile.write(b"Invalid request.\n")
+            return
+        if not self.server.watcher.contains(path):
+            # Only the watched tree is kept up to date; anything else would grow the results forever.
+            self.wfile.write(f"{path} is not below {self.server.watcher.root}.\n".encode())
+            return
+        for finding in self.server.watcher.get_findings(path):
+            self.wfile.write(f"{finding}\n".encode())
+
+
+class AnalyzerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, watcher: AnalyzerWatcher):
+        self.watcher = watcher
+        super().__init__(socket_path, AnalyzerRequestHandler)
+
+
+def remove_socket(socket_path: str):
+    """
+    Removes a Unix socket left by a server that is no longer running. Refuses to remove anything else at
+    socket_path, including the socket of a running server.
+
+    :param socket_path: Path of the Unix socket.
+    :return:
+    """
+    try:
+        mode = os.stat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f"{socket_path} exists and is not a socket")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(socket_path)
+        except ConnectionRefusedError:
+            # Nobody is listening any more.
+            try:
+                os.remove(socket_path)
+            except FileNotFoundError:
+                pass
+            return
+    raise FileExistsError(f"{socket_path} is in use by a running server")
+
+
+def serve(root: str, socket_path: str, interval: float, checks: list = CHECKS):
+    """
+    Analyzes root once, then keeps the results up to date and answers requests on a Unix socket until interrupted.
+
+    :param root: Directory to watch.
+    :param socket_path: Path of the Unix socket to listen on.
+    :param interval: Seconds between polls of the directory tree.
+    :param checks: Rules to run, from select_checks().
+    :return:
+    """
+    remove_socket(socket_path)
+    watcher = AnalyzerWatcher(root, checks)
+    watcher.refresh()
+    stop = threading.Event()
+    threading.Thread(target=watcher.watch, args=(interval, stop), daemon=True).start()
+    try:
+        with AnalyzerServer(socket_path, watcher) as server:
+            print(f"Watching {watcher.root} on {socket_path}", file=sys.stderr)
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        try:
+            remove_socket(socket_path)
+        except FileExistsError:
+            # Another server has taken over socket_path in the meantime.
+            pass
+
+
+def request_findings(socket_path: str, path: str):
+    """
+    Asks a running server for the findings of path and prints them.
+
+    :param socket_path: Path of the server's Unix socket.
+    :param path: File or directory to get findings for.
+    :return:
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall(json.dumps({"path": os.path.abspath(path)}).encode() + b"\n")
+        client.shutdown(socket.SHUT_WR)
+        with client.makefile('r') as response:
+            for finding in response:
+                print(finding, end='')
+
+
+def parse_rule_codes(value: str) -> set:
+    """
+    Converts a comma separated list of rule codes such as "S001,S010" into a set.
+
+    :param value: Comma separated rule codes.
+    :return: Set of upper case rule codes.
+    """
+    codes = {code.strip().upper() for code in value.split(",") if code.strip()}
+    unknown = codes - RULES.keys()
+    if unknown:
+        raise argparse.ArgumentTypeError(f"Unknown rule code(s): {', '.join(sorted(unknown))}.")
+    return codes
 
 
 if __name__ == '__main__':
-    if os.path.isfile(sys.argv[1]):
-        StaticCodeAnalyzer(sys.argv[1])
-    else:
-        for file in os.listdir(sys.argv[1]):
-            StaticCodeAnalyzer(os.path.join(sys.argv[1], file))
\ No newline at end of file
+    arg_parser = argparse.ArgumentParser(description="Check Python files for PEP8 violations.")
+    arg_parser.add_argument("path",
+                            help="File or directory to analyze. Directories are searched recursively.")
+    arg_parser.add_argument("--jobs",
+                            type=int,
+                            default=1,
+                            help="Number of files analyzed in parallel.")
+    arg_parser.add_argument("--cache-dir",
+                            help="Directory used to cache findings of unchanged files between runs.")
+    arg_parser.add_argument("--cache-max-size",
+                            type=int,
+                            default=64,
+                            help="Maximum size of the cache in MiB.")
+    arg_parser.add_argument("--cache-max-age",
+                            type=float,
+                            default=30,
+                            help="Days after which unused cache entries are removed.")
+    arg_parser.add_argument("--serve",
+                            metavar="SOCKET",
+                            help="Watch path and answer requests on this Unix socket instead of exiting.")
+    arg_parser.add_argument("--poll-interval",
+                            type=float,
+                            default=0.5,
+                            help="Seconds between checks for changed files in --serve mode.")
+    arg_parser.add_argument("--connect",
+                            metavar="SOCKET",
+                            help="Get the findings for path from a server started with --serve.")
+    arg_parser.add_argument("--format",
+                            choices=sorted(FINDINGS_WRITERS),
+                            default="text",
+                            help="Output format: plain text, JSON Lines or SARIF.")
+    arg_parser.add_argument("--select",
+                            type=parse_rule_codes,
+                            help="Comma separated rule codes to check, e.g. S001,S002. All rules by default.")
+    arg_parser.add_argument("--ignore",
+                            type=parse_rule_codes,
+                            help="Comma separated rule codes to skip.")
+    arg_parser.add_argument("--profile",
+                            nargs="?",
+                            const="table",
+                            choices=["table", "json"],
+                            help="Print the time spent reading files, parsing and in every rule to stderr, "
+                                 "as a table (default) or JSON.")
+    args = arg_parser.parse_args()
+    selected_checks = select_checks(args.select, args.ignore)
+    if args.serve:
+        try:
+            serve(args.path, args.serve, args.poll_interval, selected_checks)
+        except FileExistsError as err:
+            arg_parser.error(str(err))
+        sys.exit()
+    if args.connect:
+        request_findings(args.connect, args.path)
+        sys.exit()
+    result_cache = ResultCache(args.cache_dir, selected_checks) if args.cache_dir else None
+    hits = misses = errors = 0
+    profiler = Profiler() if args.profile else None
+    writer = FINDINGS_WRITERS[args.format]()
+    writer.start()
+    for path, findings, hit, stats, error in analyze_files(find_python_files(args.path), args.jobs, result_cache,
+                                                           bool(profiler), selected_checks):
+        hits += hit
+        misses += not hit
+        if error:
+            # Reported apart from the findings, so that JSON Lines and SARIF output stay valid.
+            errors += 1
+            print(f"{path}: {error}", file=sys.stderr)
+        writer.write_file(path, findings)
+        if profiler:
+            profiler.merge(stats)
+    writer.finish()
+    if result_cache:
+        result_cache.evict(args.cache_max_size * 1024 ** 2, args.cache_max_age * 24 * 60 * 60)
+        hit_rate = hits / (hits + misses) if hits + misses else 0
+        print(f"Cache: {hits} hits, {misses} misses, {hit_rate:.0%} hit rate", file=sys.stderr)
+    if profiler:
+        print(profiler.format_json() if args.profile == "json" else profiler.format_table(), file=sys.stderr)
+    if errors:
+        print(f"{errors} files could not be analyzed.", file=sys.stderr)
+        sys.exit(1)